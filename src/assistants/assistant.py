@@ -26,6 +26,10 @@ class Assistant(ABC):
     def run(self, user: 'user_config.UserConfig', send_telegram: Callable[[str], None]) -> None:
         pass
 
+    def unload_api(self, user: 'user_config.UserConfig') -> None:
+        # Drop temporary state referencing the API, it is about to be hibernated
+        pass
+
     def get_config_version(self) -> int:
         return 1
 
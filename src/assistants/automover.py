@@ -27,26 +27,20 @@ class AutoMover(Assistant):
             return
 
         now = datetime.now(user.timezone)
-        for item in user.api.items:
-            if not item.due.is_set() or item.checked:
-                continue
-            if LABEL_NAME not in item.labels:
-                continue
-            due = item.due.parsed_day
-            if now.date() > due.date():
-                content, config = parse_task_config(item.content)
-                if 'T' in item.due.date:
-                    timepart = 'T' + item.due.date.split('T', 1)[1]
-                else:
-                    timepart = ''
-                nowstr = now.strftime('%Y-%m-%d')
-                if 'automove-by' in config:
-                    try:
-                        days = int(config['automove-by']) - 1
-                        if days > 0:
-                            nowstr = (now + timedelta(days=days)).strftime('%Y-%m-%d')
-                    except ValueError as e:
-                        send_telegram('Error with {}: {}.'.format(content, e))
-                        continue
-                item.due.date = nowstr + timepart
+        for item in user.api.today_view().overdue_labelled(LABEL_NAME):
+            content, config = parse_task_config(item.content)
+            if 'T' in item.due.date:
+                timepart = 'T' + item.due.date.split('T', 1)[1]
+            else:
+                timepart = ''
+            nowstr = now.strftime('%Y-%m-%d')
+            if 'automove-by' in config:
+                try:
+                    days = int(config['automove-by']) - 1
+                    if days > 0:
+                        nowstr = (now + timedelta(days=days)).strftime('%Y-%m-%d')
+                except ValueError as e:
+                    send_telegram('Error with {}: {}.'.format(content, e))
+                    continue
+            item.due.date = nowstr + timepart
         user.api.commit()
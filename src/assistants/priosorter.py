@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Callable
 
 from assistants.assistant import Assistant
@@ -16,23 +16,9 @@ class PrioSorter(Assistant):
     handle_update = run_next_in(timedelta(seconds=1), {'item:added', 'item:updated'})
 
     def run(self, user: UserConfig, send_telegram: Callable[[str], None]) -> None:
-        prio_labels = {}
-        for label in user.api.labels:
-            if label.name.startswith('prio'):
-                try:
-                    value = int(label.name[len('prio'):])
-                    prio_labels[label.name] = value
-                except ValueError:
-                    pass
-
-        now = datetime.now(user.timezone)
-        items = []
-        for item in user.api.items:
-            if not item.due.is_set() or item.checked:
-                continue
-            due = item.due.parsed_day
-            if now.date() == due.date():
-                items.append(item)
+        prio_labels = user.api.labels.priorities
+
+        items = list(user.api.today_view().due_today)
 
         def sort_func(cur_item: Item):
             day_order = cur_item.day_order
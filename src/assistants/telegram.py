@@ -1,14 +1,106 @@
+import heapq
 from datetime import datetime, timedelta
-from typing import Iterable, Dict, Callable
+from typing import Iterable, Dict, Callable, List, Tuple, Set, Union, Iterator, cast
 
 from assistants.assistant import Assistant
 from config import config
 from config.user_config import UserConfig
+from todoistapi import todoist_api
+from todoistapi.items import Item
 from utils.utils import parse_task_config, run_every, run_next_in, local_to_utc
 
 LABEL_NAME: str = 'telegram'
 
 
+class ReminderQueue:
+
+    def __init__(self, api: 'todoist_api.TodoistAPI') -> None:
+        self.api: 'todoist_api.TodoistAPI' = api
+        self.timezone = api.timezone
+        self._heap: List[Tuple[datetime, str]] = []
+        self._scheduled: Dict[str, Tuple[datetime, str]] = {}
+        # Items without the label are never scheduled, later changes to them are picked up by the listener
+        self._dirty: Set[str] = {item.id for item in api.today_view().labelled(LABEL_NAME)}
+        # Items with a time-only override fire again every day, so they are computed again when the day changes
+        self._time_overrides: Set[str] = set()
+        self._day = datetime.now(self.timezone).date()
+        api.items.add_listener(self._items_changed)
+
+    def detach(self) -> None:
+        self.api.items.remove_listener(self._items_changed)
+
+    def _items_changed(self, items: List[Item]) -> None:
+        self._dirty.update(item.id for item in items)
+
+    def _get_due(self, item: Item) -> Union[None, Tuple[datetime, str]]:
+        self._time_overrides.discard(item.id)
+        if item.checked or item.is_deleted or LABEL_NAME not in item.labels:
+            return None
+        due = item.due.parsed_datetime_utc
+        content, config = parse_task_config(item.content)
+        if 'telegram-due' in config:
+            new_due = config['telegram-due']
+            if 'T' in new_due:
+                new_due = datetime.fromisoformat(new_due)
+                if not new_due.tzinfo:
+                    new_due = new_due.replace(tzinfo=self.timezone)
+                due = new_due
+            elif ':' in new_due:
+                parts = new_due.split(':')
+                self._time_overrides.add(item.id)
+                if not due:
+                    due = datetime.now(self.timezone)
+                due = due.replace(hour=int(parts[0]), minute=int(parts[1]), second=0, microsecond=0)
+            due = local_to_utc(due)
+        if not due:
+            return None
+        return due, content
+
+    def refresh(self) -> List[Tuple[str, ValueError]]:
+        errors = []
+        today = datetime.now(self.timezone).date()
+        if today != self._day:
+            self._day = today
+            self._dirty.update(self._time_overrides)
+        dirty, self._dirty = self._dirty, set()
+        for item_id in dirty:
+            item = self.api.items.get_by_id(item_id)
+            entry = None
+            if not item:
+                self._time_overrides.discard(item_id)
+            else:
+                try:
+                    entry = self._get_due(item)
+                except ValueError as e:
+                    errors.append((parse_task_config(item.content)[0], e))
+            if not entry:
+                self._scheduled.pop(item_id, None)
+            elif self._scheduled.get(item_id) != entry:
+                self._scheduled[item_id] = entry
+                heapq.heappush(self._heap, (entry[0], item_id))
+        return errors
+
+    def pop_due(self, last: datetime, now: datetime) -> Iterator[str]:
+        while self._heap and self._heap[0][0] <= now:
+            due, item_id = heapq.heappop(self._heap)
+            entry = self._scheduled.get(item_id)
+            # Entries are not removed from the heap when an item changes, skip outdated ones
+            if not entry or entry[0] != due:
+                continue
+            del self._scheduled[item_id]
+            if last <= due:
+                yield entry[1]
+
+    def next_due(self) -> Union[None, datetime]:
+        while self._heap:
+            due, item_id = self._heap[0]
+            entry = self._scheduled.get(item_id)
+            if entry and entry[0] == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+
 class Telegram(Assistant):
 
     def get_id(self) -> str:
@@ -21,40 +113,32 @@ class Telegram(Assistant):
         if not user.api.labels.get_by_name(LABEL_NAME):
             return
 
+        tmp = user.atmp(self)
+        queue = cast(Union[ReminderQueue, None], tmp.get('reminders'))
+        if not queue or queue.api is not user.api or queue.timezone != user.timezone:
+            if queue:
+                queue.detach()
+            queue = ReminderQueue(user.api)
+            tmp['reminders'] = queue
+
+        for content, e in queue.refresh():
+            send_telegram('Error with {}: {}.'.format(content, e))
+
         now = datetime.utcnow()
         last = user.acfg(self).last_run or (now - timedelta(days=2))
-        next_run = None
-        for item in user.api.items:
-            if item.checked:
-                continue
-            if LABEL_NAME not in item.labels:
-                continue
-            due = item.due.parsed_datetime_utc
-            content, config = parse_task_config(item.content)
-            if 'telegram-due' in config:
-                new_due = config['telegram-due']
-                try:
-                    if 'T' in new_due:
-                        new_due = datetime.fromisoformat(new_due)
-                        if not new_due.tzinfo:
-                            new_due = new_due.replace(tzinfo=user.timezone)
-                        due = new_due
-                    elif ':' in new_due:
-                        parts = new_due.split(':')
-                        if not due:
-                            due = datetime.now(user.timezone)
-                        due = due.replace(hour=int(parts[0]), minute=int(parts[1]), second=0, microsecond=0)
-                    due = local_to_utc(due)
-                except ValueError as e:
-                    send_telegram('Error with {}: {}.'.format(content, e))
-                    continue
-            if not due:
-                continue
-            if due > now and (not next_run or due < next_run):
-                next_run = due
-            if last <= due <= now:
-                send_telegram(content)
-        user.acfg(self).next_run = next_run
+        for content in queue.pop_due(last, now):
+            send_telegram(content)
+        user.acfg(self).next_run = queue.next_due()
+
+    def unload_api(self, user: UserConfig) -> None:
+        queue = cast(Union[ReminderQueue, None], user.atmp(self).pop('reminders', None))
+        if queue:
+            queue.detach()
+        # State kept by the telegram server, the last task is resolved again by its id
+        user.tmp.pop('telegram_keyboards', None)
+        last_task = cast(Union[Item, None], user.tmp.pop('telegram_last_task', None))
+        if last_task:
+            user.tmp['telegram_last_task_id'] = last_task.id
 
     def get_init_config(self) -> Dict[str, object]:
         return {
@@ -63,6 +147,7 @@ class Telegram(Assistant):
             'plain_labels': [],
             'link_labels': [],
             'forward_labels': [],
+            'digest_window': 0,
         }
 
     def get_config_allowed_keys(self) -> Iterable[str]:
@@ -73,8 +158,12 @@ class Telegram(Assistant):
             'link_labels',
             'forward_project',
             'forward_labels',
+            'digest_window',
         ]
 
+    def contains_int_value(self, key: str) -> bool:
+        return key == 'digest_window'
+
     def contains_list_value(self, key: str) -> bool:
         return key in {
             'plain_labels',
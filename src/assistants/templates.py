@@ -1,16 +1,23 @@
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, Iterable, Callable, List, Union
+from typing import Dict, Iterable, Callable, List, Union, Set, cast
 
 from assistants.assistant import Assistant
 from config import config
 from config.user_config import UserConfig
-from todoistapi.items import Item
+from storage.storage import get_storage
+from todoistapi import commit_planner
+from todoistapi.hooks import HookData
+from utils import my_json
 from utils.utils import run_every, run_next_in, parse_task_config
 
 logger = logging.getLogger(__name__)
 
+UPDATE_EVENTS = {'item:deleted', 'item:completed', 'item:uncompleted'}
+FULL_CHECK_INTERVAL = timedelta(minutes=15)
+NO_NODE = -1
+
 
 class ItemDeletedError(Exception):
     pass
@@ -22,53 +29,74 @@ class Templates(Assistant):
         return 'templates'
 
     should_run = run_every(timedelta(minutes=15))
-    handle_update = run_next_in(timedelta(seconds=1), {'item:deleted', 'item:completed'})
+
+    def handle_update(self, user: UserConfig, update: HookData) -> bool:
+        if update.data['event_name'] in UPDATE_EVENTS:
+            event_data = cast(Dict[str, object], update.data.get('event_data') or {})
+            if 'id' in event_data:
+                tmp = user.atmp(self)
+                cast(Set[str], tmp.setdefault('touched_items', set())).add(str(event_data['id']))
+        return self.schedule_run(user, update)
+
+    schedule_run = run_next_in(timedelta(seconds=1), UPDATE_EVENTS)
 
     def run(self, user: UserConfig, send_telegram: Callable[[str], None]) -> None:
+        # Runs triggered by completion events only look at the touched items, all open nodes are checked periodically
+        tmp = user.atmp(self)
+        touched = cast(Union[Set[str], None], tmp.pop('touched_items', None))
+        now = datetime.utcnow()
+        if touched is None or now - cast(datetime, tmp.get('last_full_check', datetime.min)) > FULL_CHECK_INTERVAL:
+            touched = None
+            tmp['last_full_check'] = now
         new_active = []
+        archived = []
         for template in user.acfg(self)['active']:
             if not template.finished:
                 try:
                     logger.debug('Start update_template_state')
-                    self._update_template_state(user, template)
+                    self._update_template_state(user, template, touched)
                     logger.debug('Finished update_template_state')
                 except ItemDeletedError:
                     template.finished = datetime.utcnow()
                     template.status = 'Item was deleted'
                 except Exception as e:
                     logger.warn('Template exception', exc_info=e)
-                new_active.append(template)
+            # Finished instances are moved to the archive, the config only keeps running ones
+            if template.finished:
+                archived.append(my_json.dumps(archive_entry(template)))
             else:
-                if (datetime.utcnow() - template['finished']) < timedelta(days=3):
-                    new_active.append(template)
-        user.acfg(self)['active'] = new_active
-
-    def _parse_template_item(self, user: UserConfig, item: Item) -> 'TemplateItem':
-        content, config = parse_task_config(item.content)
-        res = TemplateItem(
-            id=config.get('template-id'),
-            content=content,
-            labels=item.labels,
-            priority=item.priority,
-            due=config.get('template-due', None),
-            depends=[x for x in config.get('template-depends', '').split('|') if x],
-            children=[],
-            child_order=item.child_order,
-            item_id=None,
-            completed=False,
-        )
-        for child in user.api.items:
-            if child.parent_id == item.id:
-                res.children.append(self._parse_template_item(user, child))
-        return res
+                new_active.append(template)
+        if archived:
+            get_storage().append_archive(user.id, archived)
+            user.acfg(self)['active'] = new_active
 
     def _parse_template(self, user: UserConfig, template_id: str, project_id: str) -> 'TemplateInstance':
-        items = []
         root_item = user.api.items.get_by_id(template_id)
         project = user.api.projects.get_by_id(project_id)
-        for item in user.api.items:
-            if item.parent_id == template_id:
-                items.append(self._parse_template_item(user, item))
+        nodes = []
+        stack = [(item, NO_NODE) for item in reversed(user.api.items.select(parent_id=template_id))]
+        while stack:
+            item, parent = stack.pop()
+            content, config = parse_task_config(item.content)
+            index = len(nodes)
+            nodes.append(TemplateNode(
+                id=config.get('template-id'),
+                content=content,
+                labels=item.labels,
+                priority=item.priority,
+                due=config.get('template-due', None),
+                child_order=item.child_order,
+                parent=parent,
+                depends=[x for x in config.get('template-depends', '').split('|') if x],
+                dependents=[],
+                children=[],
+                item_id=None,
+                completed=False,
+            ))
+            if parent != NO_NODE:
+                nodes[parent].children.append(index)
+            stack.extend((child, index) for child in reversed(user.api.items.select(parent_id=item.id)))
+        link_nodes(nodes)
         return TemplateInstance(
             template=root_item.content.rstrip(':'),
             project=project.name,
@@ -76,78 +104,126 @@ class Templates(Assistant):
             start=datetime.utcnow(),
             finished=None,
             status='Running',
-            items=items,
+            nodes=nodes,
+            open=[],
+            remaining=len(nodes),
         )
 
-    def _update_template_state(self, user: UserConfig, template: 'TemplateInstance') -> None:
-        completed = set()
-        finished = [True]  # we use a list, so we can access it in the function...
-
-        def collect_completed(item: 'TemplateItem'):
-            if item.item_id:
-                my_item = user.api.items.get_by_id(item.item_id)
-                if not my_item:
-                    template.status = 'Item was deleted'
-                    template.finished = datetime.utcnow()
-                    raise ItemDeletedError()
-                if my_item.checked:
-                    completed.add(item.id)
-                else:
-                    finished[0] = False
+    def _update_template_state(self, user: UserConfig, template: 'TemplateInstance',
+                               touched: Union[Set[str], None] = None, candidates: List[int] = None) -> None:
+        # Only nodes whose dependencies or parent changed are candidates for new tasks
+        nodes = template.nodes
+        candidates = candidates or []
+        still_open = []
+        completed = 0
+        retried = False
+        for index in template.open:
+            node = nodes[index]
+            if not node.item_id:
+                # The task could not be created before
+                candidates.append(index)
+                retried = True
+                continue
+            if touched is not None and node.item_id not in touched:
+                still_open.append(index)
+                continue
+            my_item = user.api.items.get_by_id(node.item_id)
+            if not my_item:
+                template.status = 'Item was deleted'
+                template.finished = datetime.utcnow()
+                raise ItemDeletedError()
+            if my_item.checked:
+                node.completed = True
+                completed += 1
+                candidates.extend(node.dependents)
             else:
-                finished[0] = False
-            for child in item.children:
-                collect_completed(child)
-
-        for item in template.items:
-            collect_completed(item)
-
-        if finished[0]:
+                still_open.append(index)
+        reopened = self._reopen_uncompleted(user, template, touched)
+        if template.remaining - completed + len(reopened) == 0 and touched is not None:
+            # Instances only finish when all their tasks are completed at once
+            reopened += self._reopen_uncompleted(user, template, None)
+        still_open.extend(reopened)
+        if completed or reopened:
+            template.remaining = template.remaining - completed + len(reopened)
+
+        if template.remaining == 0:
+            template.open = []
             template.finished = datetime.utcnow()
             template.status = 'Finished'
             return
 
-        temp_id_to_task = {}
-
-        def create_new_items(item: 'TemplateItem', parent_id: str = None) -> None:
-            if not item.item_id:
-                for dependency in item.depends:
-                    if dependency not in completed:
-                        return
-                new_task = user.api.items.add(
-                    item.content,
-                    project_id=template.project_id,
-                    child_order=item.child_order,
-                    labels=config.ensure_plain_list(item.labels),
-                    priority=item.priority,
-                    parent_id=parent_id)
-                if item.due:
-                    new_task.due = {'string': item.due, 'lang': 'en'}
-                temp_id_to_task[new_task.id] = new_task
-                item.item_id = new_task.id
-            for child in item.children:
-                create_new_items(child, item.item_id)
-
-        for item in template.items:
-            create_new_items(item)
-
-        user.api.commit()
-
-        def assign_ids(item: 'TemplateItem'):
-            if item.item_id in temp_id_to_task:
-                item.item_id = temp_id_to_task[item.item_id].id
-            for child in item.children:
-                assign_ids(child)
-
-        for item in template.items:
-            assign_ids(item)
+        created = []
+        candidates.reverse()
+        while candidates:
+            index = candidates.pop()
+            node = nodes[index]
+            if node.item_id or not self._is_ready(nodes, node):
+                continue
+            parent_id = nodes[node.parent].item_id if node.parent != NO_NODE else None
+            new_task = user.api.items.add(
+                node.content,
+                project_id=template.project_id,
+                child_order=node.child_order,
+                labels=config.ensure_plain_list(node.labels),
+                priority=node.priority,
+                parent_id=parent_id)
+            if node.due:
+                new_task.due = {'string': node.due, 'lang': 'en'}
+            node.item_id = new_task.id
+            created.append((node, new_task, new_task.id))
+            still_open.append(index)
+            candidates.extend(node.children[::-1])
+
+        if created:
+            result = user.api.commit()
+            failed = 0
+            for node, new_task, temp_id in created:
+                if result.temp_id_status(temp_id) == commit_planner.STATUS_OK:
+                    # Temporary ids are replaced by the commit
+                    node.item_id = new_task.id
+                else:
+                    # Kept open without a task, so it is created again on the next run
+                    node.item_id = None
+                    failed += 1
+            status = 'Running' if not failed else 'Running, {} tasks could not be created'.format(failed)
+            if template.status != status:
+                template.status = status
+        if completed or created or retried or reopened:
+            template.open = still_open
+
+    @staticmethod
+    def _reopen_uncompleted(user: UserConfig, template: 'TemplateInstance',
+                            touched: Union[Set[str], None]) -> List[int]:
+        # Completed tasks can be uncompleted again, they are checked on full checks and when touched. Tasks created
+        # for their dependents are kept.
+        reopened = []
+        for index, node in enumerate(template.nodes):
+            if not node.completed or (touched is not None and node.item_id not in touched):
+                continue
+            my_item = user.api.items.get_by_id(node.item_id)
+            if not my_item:
+                template.status = 'Item was deleted'
+                template.finished = datetime.utcnow()
+                raise ItemDeletedError()
+            if not my_item.checked:
+                node.completed = False
+                reopened.append(index)
+        return reopened
+
+    @staticmethod
+    def _is_ready(nodes: List['TemplateNode'], node: 'TemplateNode') -> bool:
+        if node.parent != NO_NODE and not nodes[node.parent].item_id:
+            return False
+        for dependency in node.depends:
+            if dependency == NO_NODE or not nodes[dependency].completed:
+                return False
+        return True
 
     def get_templates(self, user: UserConfig) -> List['TemplateEntry']:
         cfg = user.acfg(self)
         if 'src_project' not in cfg:
             return []
-        template_items = [item for item in user.api.items if
-                          item.project_id == cfg['src_project'] and not item.parent_id]
+        template_items = user.api.items.select(project_id=cfg['src_project'], top_level=True)
         return [TemplateEntry(
             name=item.content.rstrip(':'),
             id=item.id,
@@ -160,7 +236,8 @@ class Templates(Assistant):
             logger.error("Failed to parse template:", e)
             return 'Invalid template'
         try:
-            self._update_template_state(user, template)
+            top_level = [index for index, node in enumerate(template.nodes) if node.parent == NO_NODE]
+            self._update_template_state(user, template, candidates=top_level)
         except ItemDeletedError:
             return 'Item was deleted ???'
         user.acfg(self)['active'].append(template)
@@ -177,24 +254,28 @@ class Templates(Assistant):
         ]
 
     def get_config_version(self) -> int:
-        return 2
+        return 3
 
     def migrate_config(self, user: UserConfig, cfg: 'config.ChangeDict', old_version: int) -> None:
         if old_version == 1:
             if 'src_project' in cfg:
                 cfg['src_project'] = str(cfg['src_project'])
+        if old_version <= 2:
+            cfg['active'] = [flatten_instance(template.to_dict()) for template in cfg['active']]
 
 
 @dataclass
-class TemplateItem:
-    id: str
+class TemplateNode:
+    id: Union[str, None]
     content: str
     labels: List[str]
     priority: int
     due: Union[str, None]
-    depends: List[str]
-    children: List['TemplateItem']
     child_order: int
+    parent: int
+    depends: List[int]
+    dependents: List[int]
+    children: List[int]
     item_id: Union[str, None]
     completed: bool
 
@@ -207,7 +288,73 @@ class TemplateInstance:
     start: datetime
     finished: Union[datetime, None]
     status: str
-    items: List['TemplateItem']
+    nodes: List['TemplateNode']
+    # Nodes with a task that is not completed yet or whose task could not be created, only these are checked
+    open: List[int]
+    remaining: int
+
+
+def archive_entry(template: 'TemplateInstance') -> Dict[str, object]:
+    return {
+        'template': template.template,
+        'project': template.project,
+        'project_id': template.project_id,
+        'start': template.start,
+        'finished': template.finished,
+        'status': template.status,
+        'tasks': len(template.nodes),
+    }
+
+
+def link_nodes(nodes: List['TemplateNode']) -> None:
+    # Dependencies are given by template id, unknown ids are never satisfied
+    by_template_id = {}
+    for index, node in enumerate(nodes):
+        if node.id:
+            by_template_id.setdefault(node.id, index)
+    for index, node in enumerate(nodes):
+        node.depends = [by_template_id.get(dependency, NO_NODE) for dependency in node.depends]
+        for dependency in node.depends:
+            if dependency != NO_NODE:
+                nodes[dependency].dependents.append(index)
+
+
+def flatten_instance(data: Dict[str, object]) -> 'TemplateInstance':
+    # Converts instances with nested template items of config version 2
+    nodes = []
+    stack = [(item, NO_NODE) for item in reversed(cast(List[Dict[str, object]], data['items']))]
+    while stack:
+        item, parent = stack.pop()
+        index = len(nodes)
+        nodes.append(TemplateNode(
+            id=cast(Union[str, None], item['id']),
+            content=cast(str, item['content']),
+            labels=list(cast(List[str], item['labels'])),
+            priority=cast(int, item['priority']),
+            due=cast(Union[str, None], item['due']),
+            child_order=cast(int, item['child_order']),
+            parent=parent,
+            depends=list(cast(List[str], item['depends'])),
+            dependents=[],
+            children=[],
+            item_id=cast(Union[str, None], item['item_id']),
+            completed=False,
+        ))
+        if parent != NO_NODE:
+            nodes[parent].children.append(index)
+        stack.extend((child, index) for child in reversed(cast(List[Dict[str, object]], item['children'])))
+    link_nodes(nodes)
+    return TemplateInstance(
+        template=cast(str, data['template']),
+        project=cast(str, data['project']),
+        project_id=cast(str, data['project_id']),
+        start=cast(datetime, data['start']),
+        finished=cast(Union[datetime, None], data['finished']),
+        status=cast(str, data['status']),
+        nodes=nodes,
+        open=[index for index, node in enumerate(nodes) if node.item_id],
+        remaining=len(nodes),
+    )
 
 
 @dataclass
@@ -0,0 +1,312 @@
+import argparse
+import json
+import timeit
+from typing import Any, Callable, Dict
+
+
+def prepare_parser(subparsers: argparse._SubParsersAction):
+    benchmark = subparsers.add_parser('benchmark')
+    benchmark_subparsers = benchmark.add_subparsers(dest='benchmark')
+
+    config_access = benchmark_subparsers.add_parser('config_access')
+    config_access.set_defaults(func=run_config_access)
+    config_access.add_argument('--number', type=int, default=200000, help='Accesses per measurement')
+
+    json_codec = benchmark_subparsers.add_parser('json')
+    json_codec.set_defaults(func=run_json)
+    json_codec.add_argument('--templates', type=int, default=500, help='Template items in the config')
+    json_codec.add_argument('--number', type=int, default=20, help='Runs per measurement')
+
+    cache_load = benchmark_subparsers.add_parser('cache_load')
+    cache_load.set_defaults(func=run_cache_load)
+    cache_load.add_argument('--items', type=int, default=50000, help='Items in the cache')
+    cache_load.add_argument('--number', type=int, default=3, help='Runs per measurement')
+
+    sync_stream = benchmark_subparsers.add_parser('sync_stream')
+    sync_stream.set_defaults(func=run_sync_stream)
+    sync_stream.add_argument('--items', type=int, default=100000, help='Items in the served account')
+
+    api_memory = benchmark_subparsers.add_parser('api_memory')
+    api_memory.set_defaults(func=run_api_memory)
+    api_memory.add_argument('--items', type=int, default=10000, help='Items in the account')
+
+    item_queries = benchmark_subparsers.add_parser('item_queries')
+    item_queries.set_defaults(func=run_item_queries)
+    item_queries.add_argument('--items', type=int, default=50000, help='Items in the account')
+    item_queries.add_argument('--number', type=int, default=10, help='Queries per measurement')
+
+    storage_io = benchmark_subparsers.add_parser('storage_io')
+    storage_io.set_defaults(func=run_storage_io)
+    storage_io.add_argument('--items', type=int, default=20000, help='Items in the cache')
+    storage_io.add_argument('--templates', type=int, default=500, help='Template items in the config')
+    storage_io.add_argument('--number', type=int, default=3, help='Runs per measurement')
+
+
+UNITS = {'ns': 1e9, 'ms': 1e3}
+
+
+def report(name: str, func: Callable[[], object], number: int, unit: str = 'ns') -> None:
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print('{:<40} {:>10.1f} {}/op'.format(name, seconds / number * UNITS[unit], unit))
+
+
+def synthetic_config(templates: int) -> Dict[str, Any]:
+    import datetime
+    from assistants.templates import TemplateNode, TemplateInstance
+
+    def template_node(i: int) -> TemplateNode:
+        return TemplateNode(id=str(i), content='Task {}'.format(i), labels=['label'], priority=1, due=None,
+                            child_order=i, parent=-1, depends=[i - 1] if i else [],
+                            dependents=[i + 1] if i + 1 < templates else [], children=[], item_id=str(10 ** 9 + i),
+                            completed=i + 1 < templates)
+
+    return {
+        'enabled': True,
+        'token': 'token',
+        'templates': {
+            'enabled': True,
+            'last_run': datetime.datetime.utcnow(),
+            'active': [TemplateInstance(template='Template', project='Project', project_id='1',
+                                        start=datetime.datetime.utcnow(), finished=None, status='Running',
+                                        nodes=[template_node(i) for i in range(templates)], open=[templates - 1],
+                                        remaining=1)],
+        },
+    }
+
+
+def synthetic_cache(items: int, all_fields: bool = False) -> Dict[str, Any]:
+    cache = {
+        'user': {'id': '1', 'tz_info': {'hours': 1, 'minutes': 0, 'timezone': 'Europe/Berlin'}},
+        'day_orders': {},
+        'projects': [{'id': str(i), 'name': 'Project {}'.format(i), 'child_order': i, 'parent_id': None}
+                     for i in range(50)],
+        'labels': [{'id': str(i), 'name': 'label{}'.format(i)} for i in range(20)],
+        'items': [{'id': str(10 ** 9 + i), 'content': 'Task {}'.format(i), 'project_id': str(i % 50),
+                   'labels': ['label{}'.format(i % 20)], 'checked': False, 'is_deleted': False, 'priority': 1,
+                   'child_order': i, 'day_order': -1, 'parent_id': None, 'description': '',
+                   'due': {'date': '2024-01-01', 'is_recurring': False, 'string': 'Jan 1'}}
+                  for i in range(items)],
+    }
+    if all_fields:
+        # Further fields the Sync API returns for items
+        for item in cache['items']:
+            item.update({'description': 'Description of {}'.format(item['content']), 'note_count': 0,
+                         'added_at': '2024-01-01T10:00:00.000000Z', 'updated_at': '2024-01-02T10:00:00.000000Z',
+                         'completed_at': None, 'user_id': '1', 'added_by_uid': '1', 'assigned_by_uid': None,
+                         'responsible_uid': None, 'section_id': None, 'is_collapsed': False, 'duration': None,
+                         'deadline': None, 'v2_id': 'v2' + item['id'], 'v2_project_id': 'v2' + item['project_id'],
+                         'v2_parent_id': None, 'v2_section_id': None})
+    return cache
+
+
+def run_config_access(args: argparse.Namespace) -> None:
+    from assistants.assistants import ASSISTANTS
+    from config.assistant_config import get_config_class
+    from config.config import ChangeDict
+
+    cfg = ChangeDict({
+        'enabled': True,
+        'token': 'token',
+        'telegram': dict(ASSISTANTS.telegram.get_init_config(), enabled=True, config_version=2, last_run=None),
+    })
+    cfg._valid = True
+    dynamic = cfg['telegram']
+    typed = get_config_class(ASSISTANTS.telegram)(cfg['telegram'])
+
+    report('ChangeDict read', lambda: dynamic['chatid'], args.number)
+    report('typed read', lambda: typed['chatid'], args.number)
+    report('ChangeDict enabled', lambda: dynamic['enabled'], args.number)
+    report('typed enabled', lambda: typed.enabled, args.number)
+    report('ChangeDict unchanged write', lambda: dynamic.__setitem__('chatid', 0), args.number)
+    report('typed unchanged write', lambda: typed.__setitem__('chatid', 0), args.number)
+    report('typed config creation', lambda: get_config_class(ASSISTANTS.telegram)(dynamic), args.number // 10)
+
+
+def run_json(args: argparse.Namespace) -> None:
+    from utils import my_json
+
+    config = synthetic_config(args.templates)
+    message = {'cmd': 'update_config', 'args': ['1'], 'kwargs': {'update': {'telegram': {'plain_labels': ['a', 'b']}}}}
+
+    for name in my_json.get_available_backends():
+        backend = my_json.create_backend(name)
+        encoded_config = backend.dumps(config)
+        encoded_message = backend.dumps(message)
+        print('{} ({} bytes config)'.format(name, len(encoded_config)))
+        report('  config save', lambda: backend.dumps(config), args.number)
+        report('  config load', lambda: backend.loads(encoded_config), args.number)
+        report('  message encode', lambda: backend.dumps(message), args.number * 1000)
+        report('  message decode', lambda: backend.loads(encoded_message), args.number * 1000)
+
+
+def run_cache_load(args: argparse.Namespace) -> None:
+    import os
+    import tempfile
+    from storage.file_storage import FileStorage, CACHE_FORMATS
+    from todoistapi.todoist_api import TodoistAPI
+    from utils.consts import CACHE_PATH
+
+    cache = synthetic_cache(args.items)
+
+    def load_all(storage: FileStorage) -> None:
+        api = TodoistAPI(None, storage, 'benchmark')
+        for item in api.items:
+            item.content
+
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir(CACHE_PATH)
+    source = FileStorage('json')
+    with open(os.path.join(CACHE_PATH, 'benchmark.json'), 'w') as f:
+        json.dump(cache, f)
+    api = TodoistAPI(None, source, 'benchmark')
+    for cache_format in CACHE_FORMATS:
+        storage = FileStorage(cache_format)
+        storage.save_api_cache('benchmark', api)
+        size = sum(os.path.getsize(os.path.join(CACHE_PATH, file)) for file in os.listdir(CACHE_PATH))
+        print('{} ({} bytes)'.format(cache_format, size))
+        report('  load', lambda: TodoistAPI(None, storage, 'benchmark'), args.number, 'ms')
+        report('  load and read all items', lambda: load_all(storage), args.number, 'ms')
+
+
+def run_storage_io(args: argparse.Namespace) -> None:
+    import os
+    import tempfile
+    from config.config import ChangeDict
+    from storage.file_storage import FileStorage
+    from todoistapi.todoist_api import TodoistAPI
+    from utils import compression
+    from utils.consts import CACHE_PATH, CONFIG_PATH
+
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir(CACHE_PATH)
+    os.mkdir(CONFIG_PATH)
+    with open(os.path.join(CACHE_PATH, 'benchmark.json'), 'w') as f:
+        json.dump(synthetic_cache(args.items), f)
+    api = TodoistAPI(None, FileStorage('json', ('none', 0)), 'benchmark')
+    config = ChangeDict(synthetic_config(args.templates))
+    config._valid = True
+    config_json = config.to_json()
+
+    settings = [('none', 0)]
+    for method in compression.METHODS[1:]:
+        settings += [(method, 1), (method, compression.DEFAULT_LEVELS[method]), (method, 9)]
+    for setting in sorted(set(settings), key=settings.index):
+        storage = FileStorage('json', setting)
+        storage.save_api_cache('benchmark', api)
+        storage.save_config('benchmark', config_json)
+        print('{} level {} ({} bytes cache, {} bytes config)'.format(
+            setting[0], setting[1], os.path.getsize(os.path.join(CACHE_PATH, 'benchmark.json')),
+            os.path.getsize(os.path.join(CONFIG_PATH, 'benchmark.json'))))
+        report('  cache write', lambda: storage.save_api_cache('benchmark', api), args.number, 'ms')
+        report('  cache read', lambda: storage.load_api_cache('benchmark'), args.number, 'ms')
+        report('  config write', lambda: storage.save_config('benchmark', config_json), args.number * 10, 'ms')
+        report('  config read', lambda: storage.load_config('benchmark'), args.number * 10, 'ms')
+
+
+def serve_sync_account(items: int, ports: 'multiprocessing.Queue') -> None:
+    import http.server
+
+    account = synthetic_cache(items)
+    account['sync_token'] = 'benchmark'
+    account['full_sync'] = True
+    body = json.dumps(account).encode()
+    del account
+
+    class SyncHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers['Content-Length']))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = http.server.HTTPServer(('127.0.0.1', 0), SyncHandler)
+    ports.put((server.server_address[1], len(body)))
+    server.serve_forever()
+
+
+def run_sync_stream(args: argparse.Namespace) -> None:
+    import multiprocessing
+    import time
+    import tracemalloc
+    from todoistapi import todoist_api
+
+    # The stand-in Sync endpoint runs in its own process, so it neither competes for the GIL nor shows up in the
+    # measured memory
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_sync_account, args=(args.items, ports), daemon=True)
+    server.start()
+    port, size = ports.get()
+    todoist_api.SYNC_URL = 'http://127.0.0.1:{}/sync'.format(port)
+    print('Serving {} items ({} bytes)'.format(args.items, size))
+    for stream in [False, True]:
+        todoist_api.STREAM_FULL_SYNC = stream
+        tracemalloc.start()
+        start = time.perf_counter()
+        api = todoist_api.get_api('token', cache=False)
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{:<10} {:>8.0f} ms {:>8.1f} MB peak {:>8.1f} MB retained ({} items)'.format(
+            'streaming' if stream else 'buffered', seconds * 1e3, peak / 2 ** 20, current / 2 ** 20,
+            len(api.items)))
+        del api
+    server.terminate()
+
+
+def run_api_memory(args: argparse.Namespace) -> None:
+    import tracemalloc
+    from todoistapi.todoist_api import TodoistAPI
+    from todoistapi import mixins
+
+    body = json.dumps(synthetic_cache(args.items, all_fields=True))
+    for retain_all in [True, False]:
+        mixins.RETAIN_ALL_FIELDS = retain_all
+        tracemalloc.start()
+        api = TodoistAPI(None, None)
+        parsed = json.loads(body)
+        api.items._update(parsed['items'])
+        api.projects._update(parsed['projects'])
+        api.labels._update(parsed['labels'])
+        del parsed
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{:<20} {:>8.2f} MB per 10k items'.format(
+            'all fields' if retain_all else 'retained fields', current / 2 ** 20 / args.items * 10000))
+        del api
+
+
+def run_item_queries(args: argparse.Namespace) -> None:
+    import datetime
+    from todoistapi.todoist_api import TodoistAPI
+    from todoistapi import columns
+
+    if not columns.available():
+        print('numpy is not installed, only the item by item filter is available')
+    day = datetime.date(2024, 1, 1)
+    cache = synthetic_cache(args.items)
+    for i, item in enumerate(cache['items']):
+        item['due'] = {'date': (day + datetime.timedelta(days=i % 30)).isoformat()} if i % 3 else None
+        item['checked'] = i % 7 == 0
+    queries = {
+        'due today': lambda api: api.items.select(checked=False, due_on=day + datetime.timedelta(days=10)),
+        'overdue with label': lambda api: api.items.select(checked=False, label='label3',
+                                                           due_before=day + datetime.timedelta(days=20)),
+        'children': lambda api: api.items.select(parent_id=cache['items'][0]['id']),
+    }
+    default_min_items = columns.COLUMNS_MIN_ITEMS
+    for name, min_items in [('item by item', args.items + 1), ('columns', 0)]:
+        columns.COLUMNS_MIN_ITEMS = min_items
+        api = TodoistAPI(None, None)
+        api.user._update(cache['user'])
+        api.items._update(json.loads(json.dumps(cache['items'])))
+        if min_items == 0 and api.items.get_columns() is None:
+            continue
+        for query, func in queries.items():
+            report('{} ({})'.format(query, name), lambda: func(api), args.number, unit='ms')
+    columns.COLUMNS_MIN_ITEMS = default_min_items
@@ -29,6 +29,12 @@ def prepare_parser(subparsers: argparse._SubParsersAction):
     enable.add_argument('assistant', choices=ASSISTANTS.keys(), help='Name of assistant')
     enable.add_argument('enabled', choices=['true', 'false'], help='Whether to enable or disable')
 
+    server_status = subparsers.add_parser('server_status')
+    server_status.set_defaults(func=run_server_status)
+
+    telegram_metrics = subparsers.add_parser('telegram_metrics')
+    telegram_metrics.set_defaults(func=run_telegram_metrics)
+
 
 def run_add_account(args: argparse.Namespace) -> None:
     with Client() as client:
@@ -51,6 +57,16 @@ def run_set_enable(args: argparse.Namespace) -> None:
         print(client.set_enabled(args.account, args.assistant, args.enabled == 'true'))
 
 
+def run_server_status(args: argparse.Namespace) -> None:
+    with Client() as client:
+        print(my_json.dumps(client.server_status()))
+
+
+def run_telegram_metrics(args: argparse.Namespace) -> None:
+    with Client() as client:
+        print(my_json.dumps(client.telegram_metrics()))
+
+
 class Client:
 
     def __init__(self) -> None:
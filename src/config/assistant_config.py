@@ -1,42 +1,125 @@
 import datetime
-from typing import Any, cast
+from typing import Any, cast, Dict, Type, Union
 
+from assistants import assistant as assistant_mod
 from config.config import ChangeDict
 
+MISSING = object()
+SLOT_PREFIX: str = '_f_'
+COMMON_KEYS = ('enabled', 'config_version', 'last_run', 'next_run')
+
+
+class ConfigSource:
+    # Where typed configs read their values from. The generation is increased whenever the values might have been
+    # changed around the typed configs, which then read them again on their next access.
+    __slots__ = ('generation', 'cfg')
+
+    def __init__(self) -> None:
+        self.generation: int = 0
+        self.cfg: Union[ChangeDict, None] = None
+
+    def invalidate(self, cfg: Union[ChangeDict, None]) -> None:
+        self.generation += 1
+        self.cfg = cfg
+
 
 class AssistantConfig:
+    # Values are read from the ChangeDict when the config is created and again after its source was invalidated. Writes
+    # always go through to the ChangeDict.
+    __slots__ = ('_cfg', '_source', '_key', '_generation') + tuple(SLOT_PREFIX + key for key in COMMON_KEYS)
+    _slots: Dict[str, str] = {key: SLOT_PREFIX + key for key in COMMON_KEYS}
+
+    def __init__(self, cfg: Union[ChangeDict, None], source: ConfigSource = None, key: str = None) -> None:
+        self._source: Union[ConfigSource, None] = source
+        self._key: Union[str, None] = key
+        self._generation: int = source.generation if source is not None else 0
+        self._read(cfg)
 
-    def __init__(self, cfg: ChangeDict) -> None:
-        self._cfg: ChangeDict = cfg
+    def _read(self, cfg: Union[ChangeDict, None]) -> None:
+        self._cfg: Union[ChangeDict, None] = cfg
+        keys = list(self._slots)
+        values = cfg.get_many(keys, MISSING) if cfg is not None else [MISSING] * len(keys)
+        for key, value in zip(keys, values):
+            setattr(self, self._slots[key], value)
+
+    def _check(self) -> None:
+        source = self._source
+        if source is not None and source.generation != self._generation:
+            self._generation = source.generation
+            self._read(source.cfg.get(self._key) if source.cfg is not None else None)
 
     def __contains__(self, item: str) -> bool:
-        return item in self._cfg
+        self._check()
+        slot = self._slots.get(item)
+        if slot is None:
+            return item in self._cfg
+        return getattr(self, slot) is not MISSING
 
     def __getitem__(self, item: str) -> Any:
-        return self._cfg[item]
+        self._check()
+        slot = self._slots.get(item)
+        if slot is None:
+            return self._cfg[item]
+        value = getattr(self, slot)
+        if value is MISSING:
+            raise KeyError(item)
+        return value
 
     def get(self, item: str, default: object = None) -> object:
-        return self._cfg.get(item, default)
+        self._check()
+        slot = self._slots.get(item)
+        if slot is None:
+            return self._cfg.get(item, default)
+        value = getattr(self, slot)
+        return default if value is MISSING else value
 
     def __setitem__(self, key: str, value: object) -> None:
+        self._check()
         self._cfg[key] = value
+        slot = self._slots.get(key)
+        if slot is not None:
+            setattr(self, slot, self._cfg[key])
 
     @property
     def enabled(self) -> bool:
-        return bool(self._cfg) and self._cfg['enabled']
+        self._check()
+        return self._f_enabled is not MISSING and bool(self._f_enabled)
 
     @property
     def last_run(self) -> datetime.datetime:
-        return cast(datetime.datetime, self._cfg.get('last_run'))
+        self._check()
+        return cast(datetime.datetime, None if self._f_last_run is MISSING else self._f_last_run)
 
     @last_run.setter
     def last_run(self, value: datetime.datetime) -> None:
-        self._cfg['last_run'] = value
+        self['last_run'] = value
 
     @property
     def next_run(self) -> datetime.datetime:
-        return cast(datetime.datetime, self._cfg.get('next_run'))
+        self._check()
+        return cast(datetime.datetime, None if self._f_next_run is MISSING else self._f_next_run)
 
     @next_run.setter
     def next_run(self, value: datetime.datetime) -> None:
-        self._cfg['next_run'] = value
+        self['next_run'] = value
+
+
+_config_classes: Dict[str, Type[AssistantConfig]] = {}
+
+
+def get_config_class(assistant: 'assistant_mod.Assistant') -> Type[AssistantConfig]:
+    assistant_id = assistant.get_id()
+    if assistant_id not in _config_classes:
+        keys = [key for key in dict.fromkeys(list(assistant.get_init_config()) + list(assistant.get_config_allowed_keys()))
+                if key not in AssistantConfig._slots]
+        slots = dict(AssistantConfig._slots)
+        slots.update({key: SLOT_PREFIX + key for key in keys})
+        _config_classes[assistant_id] = cast(Type[AssistantConfig], type(
+            '{}Config'.format(type(assistant).__name__),
+            (AssistantConfig,),
+            {
+                '__slots__': tuple(SLOT_PREFIX + key for key in keys),
+                '_slots': slots,
+            }
+        ))
+    return _config_classes[assistant_id]
@@ -1,11 +1,10 @@
 import dataclasses
 import logging
-import os
 import threading
-from typing import Iterator, Dict, Set, List, Any, Union
+from typing import Iterator, Dict, Set, List, Any, Union, Iterable
 
+from storage import storage
 from utils import my_json
-from utils.consts import CONFIG_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +14,8 @@ class ConfigManager:
     def __init__(self) -> None:
         self._lock: threading.Lock = threading.Lock()
         self._configs: Dict[str, Config] = {}
+        # Configs being loaded, their keys are known but they must not be created empty meanwhile
+        self._loading: Dict[str, threading.Event] = {}
         self.dummy_configs: Set[str] = set()
 
     def __contains__(self, item: object) -> bool:
@@ -30,39 +31,120 @@ class ConfigManager:
 
     def get(self, key: object) -> 'Config':
         logger.debug('Config Manager get %s', key)
+        key = str(key)
         with self._lock:
-            key = str(key)
-            if key not in self._configs:
-                self._configs[key] = Config(key)
-            return self._configs[key]
-
+            loading = self._loading.get(key)
+            if loading is None:
+                if key not in self._configs:
+                    self._configs[key] = Config(key)
+                return self._configs[key]
+        loading.wait()
+        return self.get(key)
+
+    def expect(self, keys: Iterable[str]) -> None:
+        # Marks configs as being loaded before loading starts, so nothing creates them empty in the meantime
+        with self._lock:
+            for key in keys:
+                if key not in self._configs:
+                    self._loading.setdefault(key, threading.Event())
 
-def wrap_in_change(value: object, root: 'ChangeDict') -> object:
+    def load(self, key: str) -> 'Config':
+        logger.debug('Config Manager load %s', key)
+        with self._lock:
+            config = self._configs.get(key)
+            loading = self._loading.setdefault(key, threading.Event()) if config is None else None
+        if config is not None:
+            # Created by get before loading was expected, the stored data is merged into it
+            stored = storage.get_storage().load_config(key)
+            with config._lock:
+                if not config._data.changed:
+                    config._data = ChangeDict(stored)
+                else:
+                    for name, value in stored.items():
+                        if name not in config._data:
+                            config._data._data[name] = value
+            return config
+        # Only publish the config once it is loaded, so it is never seen empty
+        config = Config(key)
+        try:
+            config.load()
+        finally:
+            with self._lock:
+                self._configs[key] = config
+                del self._loading[key]
+            loading.set()
+        return config
+
+
+def wrap_in_change(value: object, root: 'ChangeDict', parent: Union['ChangeDict', 'ChangeList']) -> object:
+    if isinstance(value, (ChangeDict, ChangeList)):
+        value._root = root
+        value._parent = parent
+        return value
+    if dataclasses.is_dataclass(value):
+        value = dataclasses.asdict(value)
     if isinstance(value, dict):
-        return ChangeDict(value, root=root)
+        res = ChangeDict({}, root=root, parent=parent)
+        res._data = {key: wrap_in_change(value[key], root, res) for key in value}
+        return res
     if isinstance(value, list):
-        return ChangeList(value, root=root)
+        res = ChangeList([], root=root, parent=parent)
+        res._data = [wrap_in_change(x, root, res) for x in value]
+        return res
+    return value
+
+
+def wrap_lazy(value: object, root: 'ChangeDict', parent: Union['ChangeDict', 'ChangeList']) -> object:
+    # Nested values are only wrapped on first access. The container is copied, as the unwrapped value might be shared
+    # with a snapshot returned by to_dict.
     if dataclasses.is_dataclass(value):
-        return ChangeDict(dataclasses.asdict(value), root=root)
+        return ChangeDict(dataclasses.asdict(value), root=root, parent=parent)
+    if isinstance(value, dict):
+        return ChangeDict(dict(value), root=root, parent=parent)
+    if isinstance(value, list):
+        return ChangeList(list(value), root=root, parent=parent)
     return value
 
 
+def needs_wrap(value: object) -> bool:
+    if isinstance(value, (ChangeDict, ChangeList)):
+        return False
+    return isinstance(value, (dict, list)) or dataclasses.is_dataclass(value)
+
+
 def ensure_plain_list(value: Union[List[Any], 'ChangeList']) -> List[Any]:
     if isinstance(value, ChangeList):
-        return value.to_dict()
+        return list(value.to_dict())
     return value
 
 
 class ChangeDict:
 
-    def __init__(self, data: Dict[str, object], root: 'ChangeDict' = None) -> None:
+    def __init__(self, data: Dict[str, object], root: 'ChangeDict' = None,
+                 parent: Union['ChangeDict', 'ChangeList'] = None) -> None:
         self._data: Dict[str, object] = data
         self.changed: bool = False
         self._valid: bool = False
         self._root: ChangeDict = root or self
-
-        for key in self._data:
-            self._data[key] = wrap_in_change(self._data[key], self._root)
+        self._parent: Union[ChangeDict, ChangeList, None] = parent
+        self._cache: Union[Dict[str, object], None] = None
+        self._json: Union[str, None] = None
+
+    def _get(self, item: str) -> Any:
+        value = self._data[item]
+        if needs_wrap(value):
+            value = wrap_lazy(value, self._root, self)
+            self._data[item] = value
+        return value
+
+    def _set(self, key: str, value: object) -> None:
+        if not self._root._valid:
+            raise RuntimeError()
+        if key in self._data and value == self._data[key]:
+            return
+        self._root.changed = True
+        self._data[key] = wrap_in_change(value, self._root, self)
+        invalidate(self)
 
     def __contains__(self, item: str) -> bool:
         return item in self._data
@@ -70,90 +152,137 @@ class ChangeDict:
     def __getitem__(self, item: str) -> Any:
         if not self._root._valid:
             raise RuntimeError()
-        return self._data[item]
+        return self._get(item)
 
     def __getattr__(self, item: str) -> Any:
         if not self._root._valid:
             raise RuntimeError()
         if item not in self._data:
             raise AttributeError(item)
-        return self._data[item]
+        return self._get(item)
 
     def get(self, item: str, default: object = None) -> Any:
         if not self._root._valid:
             raise RuntimeError()
-        return self._data.get(item, default)
+        if item not in self._data:
+            return default
+        return self._get(item)
 
-    def __setitem__(self, key: str, value: object) -> None:
+    def get_many(self, keys: Iterable[str], default: object = None) -> List[Any]:
         if not self._root._valid:
             raise RuntimeError()
-        if key not in self._data or value != self._data[key]:
-            self._root.changed = True
-        self._data[key] = wrap_in_change(value, self._root)
+        return [self._get(key) if key in self._data else default for key in keys]
+
+    def __setitem__(self, key: str, value: object) -> None:
+        self._set(key, value)
 
     def __setattr__(self, key: str, value: object) -> None:
-        if key in {'_root', '_data', 'changed', '_valid'}:
+        if key in {'_root', '_data', 'changed', '_valid', '_parent', '_cache', '_json'}:
             super().__setattr__(key, value)
             return
-        if not self._root._valid:
-            raise RuntimeError()
-        if key not in self._data or value != self._data[key]:
-            self._root.changed = True
-        self._data[key] = wrap_in_change(value, self._root)
+        self._set(key, value)
 
     def to_dict(self) -> Dict[str, object]:
-        res = {}
-        for key in self._data:
-            value = self._data[key]
-            if isinstance(value, ChangeDict):
-                res[key] = value.to_dict()
-            elif isinstance(value, ChangeList):
-                res[key] = value.to_dict()
-            else:
-                res[key] = value
-        return res
+        # The result is shared between callers and with later snapshots, it must not be modified
+        if self._cache is None:
+            res = {}
+            for key in self._data:
+                value = self._get(key)
+                if isinstance(value, (ChangeDict, ChangeList)):
+                    res[key] = value.to_dict()
+                else:
+                    res[key] = value
+            self._cache = res
+        return self._cache
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = '{' + my_json.backend.item_separator.join(
+                my_json.dumps(str(key)) + my_json.backend.key_separator + value_to_json(self._get(key))
+                for key in self._data) + '}'
+        return self._json
 
 
 class ChangeList:
 
-    def __init__(self, data: List[object], root: ChangeDict) -> None:
+    def __init__(self, data: List[object], root: ChangeDict, parent: Union[ChangeDict, 'ChangeList'] = None) -> None:
         self._data: List[object] = data
         self._root: ChangeDict = root
+        self._parent: Union[ChangeDict, ChangeList, None] = parent
+        self._cache: Union[List[object], None] = None
+        self._json: Union[str, None] = None
 
-        for i in range(len(self._data)):
-            self._data[i] = wrap_in_change(self._data[i], self._root)
+    def _get(self, item: int) -> Any:
+        value = self._data[item]
+        if needs_wrap(value):
+            value = wrap_lazy(value, self._root, self)
+            self._data[item] = value
+        return value
 
     def __contains__(self, item: object) -> bool:
         return item in self._data
 
-    def __getitem__(self, item: int) -> Any:
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, item: Union[int, slice]) -> Any:
         if not self._root._valid:
             raise RuntimeError()
-        return self._data[item]
+        if isinstance(item, slice):
+            return [self._get(i) for i in range(*item.indices(len(self._data)))]
+        return self._get(item)
 
     def __setitem__(self, key: int, value: object) -> None:
         if not self._root._valid:
             raise RuntimeError()
-        if value != self._data[key]:
-            self._root.changed = True
-        self._data[key] = wrap_in_change(value, self._root)
+        if value == self._data[key]:
+            return
+        self._root.changed = True
+        self._data[key] = wrap_in_change(value, self._root, self)
+        invalidate(self)
 
     def append(self, value: object) -> None:
         if not self._root._valid:
             raise RuntimeError()
         self._root.changed = True
-        self._data.append(wrap_in_change(value, self._root))
+        self._data.append(wrap_in_change(value, self._root, self))
+        invalidate(self)
 
     def to_dict(self) -> List[object]:
-        res = []
-        for i in range(len(self._data)):
-            if isinstance(self._data[i], ChangeDict):
-                res.append(self._data[i].to_dict())
-            elif isinstance(self._data[i], ChangeList):
-                res.append(self._data[i].to_dict())
-            else:
-                res.append(self._data[i])
-        return res
+        # The result is shared between callers and with later snapshots, it must not be modified
+        if self._cache is None:
+            res = []
+            for i in range(len(self._data)):
+                value = self._get(i)
+                if isinstance(value, (ChangeDict, ChangeList)):
+                    res.append(value.to_dict())
+                else:
+                    res.append(value)
+            self._cache = res
+        return self._cache
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = '[' + my_json.backend.item_separator.join(
+                value_to_json(self._get(i)) for i in range(len(self._data))) + ']'
+        return self._json
+
+
+def invalidate(node: Union[ChangeDict, ChangeList, None]) -> None:
+    while node is not None:
+        node._cache = None
+        node._json = None
+        node = node._parent
+
+
+def value_to_json(value: object) -> str:
+    if isinstance(value, (ChangeDict, ChangeList)):
+        return value.to_json()
+    return my_json.dumps(value)
+
+
+my_json.register_encoder(ChangeDict, ChangeDict.to_dict)
+my_json.register_encoder(ChangeList, ChangeList.to_dict)
 
 
 class Config:
@@ -167,14 +296,12 @@ class Config:
     def load(self) -> None:
         logger.debug('Load config %s', self.key)
         with self._lock:
-            with open(os.path.join(CONFIG_PATH, f'{self.key}.json'), 'r') as f:
-                self._data = ChangeDict(my_json.load(f))
+            self._data = ChangeDict(storage.get_storage().load_config(self.key))
 
     def save(self) -> None:
         logger.debug('Save config %s', self.key)
         with self._lock:
-            with open(os.path.join(CONFIG_PATH, f'{self.key}.json'), 'w') as f:
-                my_json.dump(self._data, f)
+            storage.get_storage().save_config(self.key, self._data.to_json())
             self._data.changed = False
 
     def enter(self) -> (ChangeDict, Dict[str, object]):
@@ -0,0 +1,24 @@
+from typing import Any, Dict, cast
+
+from config.config import Config, ConfigManager
+from config.config_wrapper import ConfigWrapper
+
+
+class ServerConfig(ConfigWrapper):
+
+    def __init__(self, config: Config) -> None:
+        super().__init__(config)
+
+    @staticmethod
+    def get(mgr: ConfigManager) -> 'ServerConfig':
+        return ServerConfig(mgr.get('server'))
+
+    @property
+    def status(self) -> Dict[str, Any]:
+        return cast(Dict[str, Any], self._tmp.setdefault('status', {
+            'ready': False,
+            'configs_total': 0,
+            'configs_loaded': 0,
+            'apis_total': 0,
+            'apis_warm': 0,
+        }))
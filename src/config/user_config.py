@@ -1,17 +1,41 @@
 import datetime
-from typing import cast, Dict, Any
+import time
+from typing import cast, Dict, Any, Union
 
 from assistants import assistant as assistant_mod
-from config.assistant_config import AssistantConfig
+from config.assistant_config import AssistantConfig, ConfigSource, get_config_class
 from config.config import ChangeDict, Config, ConfigManager
 from config.config_wrapper import ConfigWrapper
 from todoistapi import todoist_api
 
 
+class UserSettings:
+    __slots__ = ('enabled', 'token')
+
+    def __init__(self, cfg: ChangeDict) -> None:
+        self.enabled, self.token = cfg.get_many(('enabled', 'token'))
+
+
 class UserConfig(ConfigWrapper):
 
     def __init__(self, config: Config) -> None:
         super().__init__(config)
+        self._acfgs: Dict[str, AssistantConfig] = {}
+        self._source: ConfigSource = ConfigSource()
+        self._settings: Union[UserSettings, None] = None
+
+    def __enter__(self) -> 'UserConfig':
+        super().__enter__()
+        self._acfgs = {}
+        self._source.invalidate(self._cfg)
+        self._settings = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._acfgs = {}
+        self._source.invalidate(None)
+        self._settings = None
+        super().__exit__(exc_type, exc_val, exc_tb)
 
     @staticmethod
     def get(mgr: ConfigManager, key: str) -> 'UserConfig':
@@ -19,10 +43,24 @@ class UserConfig(ConfigWrapper):
 
     @property
     def cfg(self) -> ChangeDict:
+        # Values might be changed directly, so the typed configs, including those already handed out, are read again
+        self._source.invalidate(self._cfg)
+        self._settings = None
         return self._cfg
 
     def acfg(self, assistant: 'assistant_mod.Assistant') -> AssistantConfig:
-        return AssistantConfig(self._cfg.get(assistant.get_id()))
+        assistant_id = assistant.get_id()
+        res = self._acfgs.get(assistant_id)
+        if res is None:
+            res = get_config_class(assistant)(self._cfg.get(assistant_id), self._source, assistant_id)
+            self._acfgs[assistant_id] = res
+        return res
+
+    @property
+    def settings(self) -> UserSettings:
+        if self._settings is None:
+            self._settings = UserSettings(self._cfg)
+        return self._settings
 
     @property
     def tmp(self) -> Dict[str, Any]:
@@ -31,25 +69,68 @@ class UserConfig(ConfigWrapper):
     def atmp(self, assistant: 'assistant_mod.Assistant') -> Dict[str, object]:
         return cast(Dict[str, object], self._tmp.setdefault(assistant.get_id(), {}))
 
+    @property
+    def id(self) -> str:
+        return self._config.key
+
     @property
     def enabled(self) -> bool:
-        return self._cfg['enabled']
+        return self.settings.enabled
 
     @property
     def api(self) -> 'todoist_api.TodoistAPI':
-        return cast('todoist_api.TodoistAPI', self._tmp['api'])
+        return self.load_api()
+
+    def load_api(self) -> 'todoist_api.TodoistAPI':
+        api = self._tmp.get('api')
+        if api is None:
+            # Only the cache is restored here, the runner syncs it afterwards
+            api = todoist_api.get_api(self.token, sync=False, user_id=self.id)
+            self._tmp['api'] = api
+            self._tmp.pop('api_hibernated', None)
+        return cast('todoist_api.TodoistAPI', api)
+
+    def mark_active(self) -> None:
+        # Only requests of the user count as activity, the runner's own use of the API does not keep it resident
+        self._tmp['api_last_access'] = time.monotonic()
+
+    def unload_api(self) -> None:
+        api = cast('todoist_api.TodoistAPI', self._tmp.pop('api'))
+        api.close()
+        self._tmp['api_timezone'] = api.timezone
+        self._tmp['api_hibernated'] = True
+
+    @property
+    def api_loaded(self) -> bool:
+        return 'api' in self._tmp
+
+    @property
+    def resident_api(self) -> Union['todoist_api.TodoistAPI', None]:
+        # Neither counts as an access nor restores a hibernated API
+        return cast(Union['todoist_api.TodoistAPI', None], self._tmp.get('api'))
+
+    @property
+    def api_hibernated(self) -> bool:
+        return 'api_hibernated' in self._tmp
+
+    @property
+    def api_last_access(self) -> float:
+        return cast(float, self._tmp.get('api_last_access', 0.0))
 
     @property
     def timezone(self) -> datetime.timezone:
+        # Avoid waking up a hibernated API just for its timezone
+        if not self.api_loaded and 'api_timezone' in self._tmp:
+            return cast(datetime.timezone, self._tmp['api_timezone'])
         return self.api.timezone
 
     @property
     def token(self) -> str:
-        return self._cfg['token']
+        return self.settings.token
 
     @property
     def api_last_sync(self) -> datetime.datetime:
-        return cast(datetime.datetime, self._tmp['api_last_sync'])
+        return cast(datetime.datetime, self._tmp.get('api_last_sync', datetime.datetime.min))
 
     @api_last_sync.setter
     def api_last_sync(self, value: datetime.datetime) -> None:
@@ -73,8 +73,9 @@ def config() -> object:
         projects = client.get_projects(session['userid'])
         labels = sorted(client.get_labels(session['userid']), key=lambda x: x['name'])
         templates = client.get_templates(session['userid'])
+        archived_templates = client.get_template_archive(session['userid']) if enabled.get('templates') else []
         return render_template('config.html', config=current_config, enabled=enabled, projects=projects, labels=labels,
-                               templates=templates)
+                               templates=templates, archived_templates=archived_templates)
 
 
 @app.route('/config/update/<assistant>', methods=['POST'])
@@ -85,18 +86,26 @@ def update_config(assistant: str) -> object:
         flash('Unknown assistant ' + assistant)
         return redirect(url_for('config'))
     assist = ASSISTANTS[assistant]
-    with Client() as client:
-        if 'enabled' in request.form:
-            client.set_enabled(session['userid'], assistant, request.form['enabled'] == 'true')
-
-        update = {}
-        for key in assist.get_config_allowed_keys():
-            if key in request.form:
-                intstr = int if assist.contains_int_value(key) else str
+    update = {}
+    for key in assist.get_config_allowed_keys():
+        if key in request.form:
+            intstr = int if assist.contains_int_value(key) else str
+            try:
                 if assist.contains_list_value(key):
                     update[key] = list(filter(bool, map(intstr, request.form.getlist(key))))
+                elif intstr is int:
+                    # An empty field falls back to 0, negative numbers are not accepted
+                    update[key] = int(request.form[key].strip() or 0)
+                    if update[key] < 0:
+                        raise ValueError(key)
                 else:
-                    update[key] = intstr(request.form[key])
+                    update[key] = request.form[key]
+            except ValueError:
+                flash('Invalid value for ' + key)
+                return redirect(url_for('config'))
+    with Client() as client:
+        if 'enabled' in request.form:
+            client.set_enabled(session['userid'], assistant, request.form['enabled'] == 'true')
         if update:
             client.update_config(session['userid'], {assistant: update})
     return redirect(url_for('config'))
@@ -0,0 +1,55 @@
+import datetime
+import logging
+import os
+import time
+from typing import List, Tuple
+
+from assistants.assistants import ASSISTANTS
+from config.config import ConfigManager
+from config.user_config import UserConfig
+
+logger = logging.getLogger(__name__)
+
+# APIs not accessed for this many seconds are hibernated
+API_IDLE_TIMEOUT = float(os.environ.get('TODOISTANT_API_IDLE_TIMEOUT', 3600))
+# Maximum number of Todoist objects kept in memory over all users, 0 disables the limit
+API_BUDGET = int(os.environ.get('TODOISTANT_API_BUDGET', 0))
+
+
+def hibernate(user: UserConfig) -> bool:
+    api = user.resident_api
+    if not api or user.api_last_sync == datetime.datetime.min:
+        return False
+    # Everything else was written to the cache by the last sync
+    if api.has_pending_commands():
+        return False
+    for assistant in ASSISTANTS:
+        assistant.unload_api(user)
+    user.unload_api()
+    return True
+
+
+def hibernate_idle(mgr: ConfigManager) -> None:
+    now = time.monotonic()
+    resident: List[Tuple[float, str, int]] = []
+    for account in mgr:
+        with UserConfig.get(mgr, account) as user:
+            api = user.resident_api
+            if not api:
+                continue
+            if now - user.api_last_access > API_IDLE_TIMEOUT:
+                if hibernate(user):
+                    logger.info('Hibernated idle API of %s', account)
+                    continue
+            resident.append((user.api_last_access, account, api.object_count()))
+    if not API_BUDGET:
+        return
+    total = sum(size for _, _, size in resident)
+    # Least recently used first
+    for _, account, size in sorted(resident):
+        if total <= API_BUDGET:
+            break
+        with UserConfig.get(mgr, account) as user:
+            if hibernate(user):
+                logger.info('Hibernated API of %s to stay within budget', account)
+                total -= size
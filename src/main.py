@@ -2,7 +2,9 @@
 import argparse
 import os
 
+import benchmark
 import client
+from storage import migration
 
 os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -27,6 +29,8 @@ def main() -> None:
     frontend.add_argument('port', type=int)
 
     client.prepare_parser(subparsers)
+    benchmark.prepare_parser(subparsers)
+    migration.prepare_parser(subparsers)
 
     args = parser.parse_args()
     if 'func' in args:
@@ -1,13 +1,14 @@
 import datetime
 import logging
 import threading
-from typing import List
+from typing import List, Union
 
 from assistants.assistant import Assistant
 from assistants.assistants import ASSISTANTS
 from config.config import ConfigManager
 from config.telegram_server_config import TelegramServerConfig
 from config.user_config import UserConfig
+from hibernation import hibernate_idle
 from todoistapi.hooks import HookData
 from utils.utils import sync_with_retry
 
@@ -19,8 +20,9 @@ def run_now(assistant: Assistant, user: UserConfig, mgr: ConfigManager) -> None:
         chatid = user.cfg['telegram']['chatid']
         if chatid <= 0:
             return
+        digest_window = user.cfg['telegram'].get('digest_window', 0)
         with TelegramServerConfig.get(mgr) as telegram_cfg:
-            telegram_cfg.telegram.send_message(chatid, message)
+            telegram_cfg.telegram.send_message(chatid, message, digest_window)
 
     if user.acfg(assistant).enabled:
         assistant.run(user, send_message)
@@ -52,6 +54,8 @@ class Runner:
                     if userid not in self.config_manager:
                         continue
                     with UserConfig.get(self.config_manager, userid) as user:
+                        # Webhooks report changes the user made in Todoist
+                        user.mark_active()
                         for assistant in ASSISTANTS:
                             if user.acfg(assistant).enabled:
                                 logger.debug('Check whether %s needs to handle update', assistant)
@@ -61,11 +65,16 @@ class Runner:
                 if had_update:
                     logger.debug('Received updates')
 
+                next_wakeup = None
                 for account in self.config_manager:
                     api_synced = False
                     with UserConfig.get(self.config_manager, account) as user:
                         if not user.enabled:
                             continue
+                        if user.api_last_sync == datetime.datetime.min:
+                            # The initial sync is deferred from startup to the runner
+                            sync_with_retry(user)
+                            api_synced = True
 
                         for assistant in ASSISTANTS:
                             if user.acfg(assistant).enabled:
@@ -76,12 +85,28 @@ class Runner:
                                     logger.debug('Run %s for %s', assistant, account)
                                     run_now(assistant, user, self.config_manager)
                                     logger.debug('Finished %s for %s', assistant, account)
-                self.new_update.wait(3 if had_update else 60)
+                                next_run = user.acfg(assistant).next_run
+                                if next_run and (not next_wakeup or next_run < next_wakeup):
+                                    next_wakeup = next_run
+                hibernate_idle(self.config_manager)
+                self.new_update.wait(self._get_wait_time(3 if had_update else 60, next_wakeup))
+
+    @staticmethod
+    def _get_wait_time(default: float, next_wakeup: Union[None, datetime.datetime]) -> float:
+        if not next_wakeup:
+            return default
+        # should_run only triggers once next_run lies strictly in the past
+        until_wakeup = (next_wakeup - datetime.datetime.utcnow()).total_seconds() + 0.01
+        return max(0.0, min(default, until_wakeup))
 
     def receive_update(self, update: HookData) -> None:
         with self.new_update:
             self.update_queue.append(update)
             self.new_update.notify_all()
 
+    def wake(self) -> None:
+        with self.new_update:
+            self.new_update.notify_all()
+
     def shutdown(self) -> None:
         self.should_shutdown.set()
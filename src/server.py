@@ -1,10 +1,10 @@
 import argparse
-import datetime
 import logging
 import os
 import socketserver
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 
 import dotenv
@@ -13,11 +13,12 @@ import runner
 import server_handlers
 from assistants.assistants import ASSISTANTS
 from config.config import ConfigManager
+from config.server_config import ServerConfig
 from config.user_config import UserConfig
 from telegram.telegram_server import TelegramServer
-from todoistapi import todoist_api
+from storage.storage import get_storage
 from utils import my_json
-from utils.consts import SOCKET_NAME, CACHE_PATH, CONFIG_PATH
+from utils.consts import SOCKET_NAME, ARCHIVE_PATH, CACHE_PATH, CONFIG_PATH
 
 dotenv.load_dotenv('secrets.env')
 
@@ -31,6 +32,8 @@ stream_handler.setLevel(logging.INFO)
 logging.getLogger().addHandler(stream_handler)
 logger = logging.getLogger(__name__)
 
+STARTUP_WORKERS = 8
+
 config_manager = ConfigManager()
 
 
@@ -62,35 +65,81 @@ def init_fs() -> None:
         os.mkdir(CACHE_PATH)
     if not os.path.exists(CONFIG_PATH):
         os.mkdir(CONFIG_PATH)
+    if not os.path.isdir(ARCHIVE_PATH):
+        os.mkdir(ARCHIVE_PATH)
+
+
+def load_user(userid: str) -> None:
+    logger.info('Load config for user %s...', userid)
+    config_manager.load(userid)
+    with UserConfig.get(config_manager, userid) as user:
+        for assistant in ASSISTANTS:
+            acfg = user.acfg(assistant)
+            if not acfg.enabled:
+                continue
+            old_version = acfg['config_version']
+            if old_version < assistant.get_config_version():
+                logger.info('Migrate %s from config version %s to %s', assistant,
+                            old_version, assistant.get_config_version())
+                assistant.migrate_config(user, acfg, old_version)
+                acfg['config_version'] = assistant.get_config_version()
+    with ServerConfig.get(config_manager) as server_cfg:
+        server_cfg.status['configs_loaded'] += 1
+    logger.info('Config loaded for user %s...', userid)
 
 
 def init_config() -> None:
     logger.info('Load config...')
-    for file in os.listdir(CONFIG_PATH):
-        if file.endswith('.json'):
-            userid = file[:-5]
-            logger.info('Load config for user %s...', userid)
-            account = config_manager.get(userid)
-            account.load()
-            with account as (cfg, tmp):
-                if cfg['enabled']:
-                    tmp['api'] = todoist_api.get_api(cfg['token'])
-                    tmp['api_last_sync'] = datetime.datetime.utcnow()
-            with UserConfig.get(config_manager, userid) as user:
-                for assistant in ASSISTANTS:
-                    acfg = user.acfg(assistant)
-                    if not acfg.enabled:
-                        continue
-                    old_version = acfg['config_version']
-                    if old_version < assistant.get_config_version():
-                        logger.info('Migrate %s from config version %s to %s', assistant,
-                                    old_version, assistant.get_config_version())
-                        assistant.migrate_config(user, acfg, old_version)
-                        acfg['config_version'] = assistant.get_config_version()
-            logger.info('Config loaded for user %s...', userid)
+    config_manager.dummy_configs.add('server')
+    userids = get_storage().list_configs()
+    with ServerConfig.get(config_manager) as server_cfg:
+        server_cfg.status['configs_total'] = len(userids)
+    config_manager.expect(userids)
+    with ThreadPoolExecutor(STARTUP_WORKERS, thread_name_prefix='config-loader') as pool:
+        for _ in pool.map(load_user, userids):
+            pass
     logger.info('Config loaded')
 
 
+def collect_api_caches() -> None:
+    # Caches of unknown users and of rotated tokens are orphaned. Caches still keyed by the current token are moved
+    # on first load.
+    known = set()
+    for userid in config_manager:
+        with UserConfig.get(config_manager, userid) as user:
+            known.add(user.id)
+            if user.token:
+                known.add(user.token)
+    storage = get_storage()
+    for key in storage.list_api_caches():
+        if key not in known:
+            logger.info('Delete orphaned API cache')
+            storage.delete_api_cache(key)
+
+
+def warm_up_api(userid: str) -> None:
+    with UserConfig.get(config_manager, userid) as user:
+        if user.enabled:
+            # Warmed up APIs stay resident for one idle period, unless the user becomes active
+            user.mark_active()
+            user.load_api()
+    with ServerConfig.get(config_manager) as server_cfg:
+        server_cfg.status['apis_warm'] += 1
+
+
+def start_warm_up() -> None:
+    # API caches are restored in the background, anything needing one earlier restores it on first access.
+    # Network syncs are left to the runner.
+    logger.info('Starting API warm-up...')
+    userids = list(config_manager)
+    with ServerConfig.get(config_manager) as server_cfg:
+        server_cfg.status['apis_total'] = len(userids)
+    pool = ThreadPoolExecutor(STARTUP_WORKERS, thread_name_prefix='api-warm-up')
+    for userid in userids:
+        pool.submit(warm_up_api, userid)
+    pool.shutdown(wait=False)
+
+
 def start_server() -> ThreadingServer:
     logger.info('Starting server...')
     server = ThreadingServer(SOCKET_NAME, RequestHandler)
@@ -133,10 +182,15 @@ def start_runner() -> runner.Runner:
 
 def run_server(args: argparse.Namespace) -> None:
     init_fs()
-    init_config()
     server = start_server()
+    init_config()
+    collect_api_caches()
     my_telegram = start_telegram()
     my_runner = start_runner()
+    start_warm_up()
+    with ServerConfig.get(config_manager) as server_cfg:
+        server_cfg.status['ready'] = True
+    logger.info('Server ready')
 
     try:
         while True:
@@ -4,11 +4,13 @@ from typing import Callable, Dict, List, Any, Union
 from assistants.assistants import ASSISTANTS
 from config.config import ConfigManager, ChangeDict
 from config.runner_config import RunnerConfig
+from config.server_config import ServerConfig
 from config.telegram_server_config import TelegramServerConfig
 from config.user_config import UserConfig
+from storage.storage import get_storage
 from todoistapi import todoist_api
 from todoistapi.hooks import HookData
-from utils.utils import sync_if_necessary, sort_projects
+from utils.utils import sync_if_necessary
 
 handlers = {}
 
@@ -46,13 +48,19 @@ def enable_account(account: str, enabled: bool, mgr: ConfigManager) -> str:
 def set_token(account: str, token: str, mgr: ConfigManager) -> str:
     if account not in mgr:
         return 'unknown account'
-    api = todoist_api.get_api(token)
-    if not api.had_successful_sync():
+    probe = todoist_api.get_api(token, sync=False, cache=False)
+    probe.sync_user_info()
+    if not probe.had_successful_sync():
         return 'bad token'
+    if probe.user.id != account:
+        return 'token belongs to another account'
     with UserConfig.get(mgr, account) as user:
+        user.mark_active()
         user.cfg['enabled'] = True
         user.cfg['token'] = token
-        user.tmp['api'] = api
+        # Keep the cached state of the account, only the credential changes
+        user.api.set_token(token)
+        user.api.sync()
         user.api_last_sync = datetime.datetime.utcnow()
     return 'ok'
 
@@ -76,9 +84,7 @@ def get_config(account: str, mgr: ConfigManager) -> Union[Dict[str, object], Non
     if account not in mgr:
         return None
     with UserConfig.get(mgr, account) as user:
-        cfg_dict = user.cfg.to_dict()
-        del cfg_dict['token']
-        return cfg_dict
+        return {key: value for key, value in user.cfg.to_dict().items() if key != 'token'}
 
 
 @handler
@@ -106,11 +112,12 @@ def get_projects(account: str, mgr: ConfigManager) -> Union[List[object], None]:
     if account not in mgr:
         return None
     with UserConfig.get(mgr, account) as user:
+        user.mark_active()
         sync_if_necessary(user)
         return [{
             'name': project.name,
             'id': project.id,
-        } for project in sort_projects(user.api.projects)]
+        } for project in user.api.projects.sorted()]
 
 
 @handler
@@ -118,6 +125,7 @@ def get_labels(account: str, mgr: ConfigManager) -> Union[List[object], None]:
     if account not in mgr:
         return None
     with UserConfig.get(mgr, account) as user:
+        user.mark_active()
         sync_if_necessary(user)
         return [{
             'name': label.name,
@@ -130,6 +138,7 @@ def get_templates(account: str, mgr: ConfigManager) -> Union[List[object], None]
     if account not in mgr:
         return None
     with UserConfig.get(mgr, account) as user:
+        user.mark_active()
         sync_if_necessary(user)
         if 'templates' not in user.cfg:
             return []
@@ -141,11 +150,38 @@ def start_template(account: str, template: str, project: str, mgr: ConfigManager
     if account not in mgr:
         return None
     with UserConfig.get(mgr, account) as user:
+        user.mark_active()
         sync_if_necessary(user)
         ASSISTANTS.templates.start(user, template, project)
     return 'ok'
 
 
+@handler
+def get_template_archive(account: str, mgr: ConfigManager) -> Union[List[object], None]:
+    if account not in mgr:
+        return None
+    # Read from storage on each request, the archive is never kept in memory
+    return list(reversed(get_storage().load_archive(account)))
+
+
+@handler
+def server_status(mgr: ConfigManager) -> Dict[str, Any]:
+    with ServerConfig.get(mgr) as server_cfg:
+        status = dict(server_cfg.status)
+    status['apis_resident'] = 0
+    status['apis_hibernated'] = 0
+    status['resident_objects'] = 0
+    for account in mgr:
+        with UserConfig.get(mgr, account) as user:
+            api = user.resident_api
+            if api:
+                status['apis_resident'] += 1
+                status['resident_objects'] += api.object_count()
+            elif user.api_hibernated:
+                status['apis_hibernated'] += 1
+    return status
+
+
 @handler
 def telegram_update(token: str, update: Any, mgr: ConfigManager) -> str:
     with TelegramServerConfig.get(mgr) as telegram_cfg:
@@ -153,6 +189,12 @@ def telegram_update(token: str, update: Any, mgr: ConfigManager) -> str:
     return 'ok'
 
 
+@handler
+def telegram_metrics(mgr: ConfigManager) -> Dict[str, Any]:
+    with TelegramServerConfig.get(mgr) as telegram_cfg:
+        return telegram_cfg.telegram.get_metrics()
+
+
 @handler
 def telegram_disconnect(account: str, mgr: ConfigManager) -> str:
     if account not in mgr:
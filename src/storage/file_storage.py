@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import struct
+from typing import Any, Dict, List, Tuple, Union
+
+from storage.storage import Storage, API_CACHE_KINDS, ARCHIVE_MAX_ENTRIES
+from todoistapi import todoist_api
+from todoistapi.snapshot import Snapshot, SnapshotWriter
+from utils import compression as compression_mod, my_json
+from utils.consts import ARCHIVE_PATH, CONFIG_PATH, CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMATS = ('json', 'snapshot')
+
+
+# noinspection PyProtectedMember
+class FileStorage(Storage):
+
+    def __init__(self, cache_format: str = None, compression: Tuple[str, int] = None) -> None:
+        self._cache_format: str = cache_format or os.environ.get('TODOISTANT_CACHE_FORMAT', 'json')
+        if self._cache_format not in CACHE_FORMATS:
+            raise ValueError('Unknown cache format {}'.format(self._cache_format))
+        self._compression: Tuple[str, int] = compression or compression_mod.get_default()
+        self._archive_sizes: Dict[str, int] = {}
+        # Snapshots stay mapped while objects loaded from them might still be decoded
+        self._snapshots: Dict[str, Snapshot] = {}
+
+    def _read(self, path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return compression_mod.decompress(f.read())
+
+    def _write(self, path: str, data: bytes) -> None:
+        with open(path, 'wb') as f:
+            f.write(compression_mod.compress(data, *self._compression))
+
+    def list_configs(self) -> List[str]:
+        return [file[:-5] for file in os.listdir(CONFIG_PATH) if file.endswith('.json')]
+
+    def load_config(self, key: str) -> Dict[str, Any]:
+        return my_json.loads(self._read(os.path.join(CONFIG_PATH, f'{key}.json')))
+
+    def save_config(self, key: str, data: str) -> None:
+        self._write(os.path.join(CONFIG_PATH, f'{key}.json'), data.encode('utf-8'))
+
+    def list_api_caches(self) -> List[str]:
+        return list({os.path.splitext(file)[0] for file in os.listdir(CACHE_PATH)
+                     if file.endswith('.json') or file.endswith('.snap')})
+
+    def load_api_cache(self, key: str) -> Union[None, Dict[str, Any]]:
+        snapshot_file = os.path.join(CACHE_PATH, f'{key}.snap')
+        if os.path.isfile(snapshot_file):
+            try:
+                snapshot = Snapshot(snapshot_file)
+            except (ValueError, IndexError, struct.error) as e:
+                # A full sync replaces the unreadable snapshot
+                logger.warning('Ignore unreadable API snapshot: %s', e)
+                return None
+            self.release_api_cache(key)
+            self._snapshots[key] = snapshot
+            cache = dict(snapshot.state)
+            for kind in API_CACHE_KINDS:
+                cache[kind] = snapshot.records(kind)
+            return cache
+        cache_file = os.path.join(CACHE_PATH, f'{key}.json')
+        cache_sync_file = os.path.join(CACHE_PATH, f'{key}.sync')
+        if not os.path.isfile(cache_file):
+            return None
+        cache = json.loads(self._read(cache_file))
+        # If there is a sync file but no cache file we want to perform a full sync
+        cache['sync_token'] = None
+        if os.path.isfile(cache_sync_file):
+            with open(cache_sync_file) as f:
+                cache['sync_token'] = f.readline().strip()
+        return cache
+
+    def save_api_cache(self, key: str, api: 'todoist_api.TodoistAPI') -> None:
+        if self._cache_format == 'snapshot':
+            # Snapshots are memory mapped, so they are never compressed
+            objects = {}
+            for kind in API_CACHE_KINDS:
+                manager = getattr(api, kind)
+                manager._take_changes()
+                objects[kind] = manager._dump_cache()
+            # All objects were decoded by dumping them, so the replaced snapshot is not needed anymore
+            self.release_api_cache(key)
+            SnapshotWriter().write(os.path.join(CACHE_PATH, f'{key}.snap'), api._sync_token,
+                                   api.user._dump_cache(), api._day_orders, objects)
+            for extension in ['json', 'sync']:
+                self._remove(key, extension)
+            return
+        to_save = {
+            'user': api.user._dump_cache(),
+            'day_orders': api._day_orders,
+        }
+        for kind in API_CACHE_KINDS:
+            manager = getattr(api, kind)
+            manager._take_changes()
+            to_save[kind] = manager._dump_cache()
+        self.release_api_cache(key)
+        self._write(os.path.join(CACHE_PATH, f'{key}.json'), json.dumps(to_save).encode('utf-8'))
+        with open(os.path.join(CACHE_PATH, f'{key}.sync'), 'w') as f:
+            print(api._sync_token, file=f)
+        self._remove(key, 'snap')
+
+    def delete_api_cache(self, key: str) -> None:
+        self.release_api_cache(key)
+        for extension in ['json', 'sync', 'snap']:
+            self._remove(key, extension)
+
+    def release_api_cache(self, key: str) -> None:
+        snapshot = self._snapshots.pop(key, None)
+        if snapshot is not None:
+            snapshot.close()
+
+    def append_archive(self, key: str, entries: List[str]) -> None:
+        # Archives are only appended to, so they are never compressed
+        path = os.path.join(ARCHIVE_PATH, f'{key}.jsonl')
+        if key not in self._archive_sizes:
+            self._archive_sizes[key] = len(self._read_archive(path))
+        with open(path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(entry + '\n')
+        self._archive_sizes[key] += len(entries)
+        # Trimmed once twice the limit is reached, so the file is only rewritten every so often
+        if self._archive_sizes[key] > 2 * ARCHIVE_MAX_ENTRIES:
+            lines = self._read_archive(path)[-ARCHIVE_MAX_ENTRIES:]
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            os.replace(path + '.tmp', path)
+            self._archive_sizes[key] = len(lines)
+
+    def load_archive(self, key: str) -> List[Dict[str, Any]]:
+        lines = self._read_archive(os.path.join(ARCHIVE_PATH, f'{key}.jsonl'))
+        return [my_json.loads(line) for line in lines[-ARCHIVE_MAX_ENTRIES:]]
+
+    @staticmethod
+    def _read_archive(path: str) -> List[str]:
+        if not os.path.isfile(path):
+            return []
+        with open(path, encoding='utf-8') as f:
+            # A partially written last line is ignored
+            return [line for line in f if line.endswith('\n')]
+
+    @staticmethod
+    def _remove(key: str, extension: str) -> None:
+        path = os.path.join(CACHE_PATH, f'{key}.{extension}')
+        if os.path.isfile(path):
+            os.remove(path)
@@ -0,0 +1,47 @@
+import argparse
+import logging
+
+from storage.file_storage import FileStorage, CACHE_FORMATS
+from storage.storage import create_storage
+from todoistapi.todoist_api import TodoistAPI
+from utils import my_json
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_parser(subparsers: argparse._SubParsersAction):
+    migrate_storage = subparsers.add_parser('migrate_storage')
+    migrate_storage.set_defaults(func=run_migrate_storage)
+    migrate_storage.add_argument('source', choices=['file', 'sqlite'], help='Storage to read from')
+    migrate_storage.add_argument('target', choices=['file', 'sqlite'], help='Storage to write to')
+
+    convert_cache = subparsers.add_parser('convert_cache')
+    convert_cache.set_defaults(func=run_convert_cache)
+    convert_cache.add_argument('format', choices=CACHE_FORMATS, help='Format of the API cache files')
+
+
+# noinspection PyProtectedMember
+def run_migrate_storage(args: argparse.Namespace) -> None:
+    source = create_storage(args.source)
+    target = create_storage(args.target)
+    for key in source.list_configs():
+        print('Migrate config {}'.format(key))
+        target.save_config(key, my_json.dumps(source.load_config(key)))
+        archive = source.load_archive(key)
+        if archive:
+            target.append_archive(key, [my_json.dumps(entry) for entry in archive])
+    for key in source.list_api_caches():
+        print('Migrate API cache {}'.format(key))
+        api = TodoistAPI(None, source, key)
+        for manager in [api.items, api.projects, api.labels]:
+            manager._changed = {obj.id for obj in manager}
+        target.save_api_cache(key, api)
+
+
+def run_convert_cache(args: argparse.Namespace) -> None:
+    source = FileStorage()
+    target = FileStorage(args.format)
+    for key in source.list_api_caches():
+        print('Convert API cache {}'.format(key))
+        api = TodoistAPI(None, source, key)
+        target.save_api_cache(key, api)
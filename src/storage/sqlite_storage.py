@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Union
+
+from storage.storage import Storage, API_CACHE_KINDS, ARCHIVE_MAX_ENTRIES
+from todoistapi import todoist_api
+from utils import my_json
+from utils.consts import DATABASE_PATH
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS configs (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS api_state (
+    cache_key TEXT PRIMARY KEY,
+    sync_token TEXT,
+    user TEXT NOT NULL,
+    day_orders TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS api_objects (
+    cache_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (cache_key, kind, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS archive (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archive_key ON archive (key, seq);
+'''
+
+
+# noinspection PyProtectedMember
+class SqliteStorage(Storage):
+
+    def __init__(self, path: str = DATABASE_PATH) -> None:
+        self._path: str = path
+        self._local: threading.local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        if not hasattr(self._local, 'connection'):
+            connection = sqlite3.connect(self._path)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return self._local.connection
+
+    def list_configs(self) -> List[str]:
+        return [row[0] for row in self._connection().execute('SELECT key FROM configs')]
+
+    def load_config(self, key: str) -> Dict[str, Any]:
+        row = self._connection().execute('SELECT data FROM configs WHERE key = ?', (key,)).fetchone()
+        if not row:
+            raise FileNotFoundError(key)
+        return my_json.loads(row[0])
+
+    def save_config(self, key: str, data: str) -> None:
+        with self._connection() as connection:
+            connection.execute('INSERT INTO configs (key, data) VALUES (?, ?) '
+                               'ON CONFLICT (key) DO UPDATE SET data = excluded.data', (key, data))
+
+    def list_api_caches(self) -> List[str]:
+        return [row[0] for row in self._connection().execute('SELECT cache_key FROM api_state')]
+
+    def load_api_cache(self, key: str) -> Union[None, Dict[str, Any]]:
+        connection = self._connection()
+        row = connection.execute('SELECT sync_token, user, day_orders FROM api_state WHERE cache_key = ?',
+                                 (key,)).fetchone()
+        if not row:
+            return None
+        cache = {
+            'sync_token': row[0],
+            'user': json.loads(row[1]),
+            'day_orders': json.loads(row[2]),
+        }
+        for kind in API_CACHE_KINDS:
+            cache[kind] = [json.loads(data) for data, in connection.execute(
+                'SELECT data FROM api_objects WHERE cache_key = ? AND kind = ?', (key, kind))]
+        return cache
+
+    def save_api_cache(self, key: str, api: 'todoist_api.TodoistAPI') -> None:
+        with self._connection() as connection:
+            connection.execute('INSERT INTO api_state (cache_key, sync_token, user, day_orders) VALUES (?, ?, ?, ?) '
+                               'ON CONFLICT (cache_key) DO UPDATE SET sync_token = excluded.sync_token, '
+                               'user = excluded.user, day_orders = excluded.day_orders',
+                               (key, api._sync_token, json.dumps(api.user._dump_cache()), json.dumps(api._day_orders)))
+            for kind in API_CACHE_KINDS:
+                manager = getattr(api, kind)
+                upserts = []
+                deletes = []
+                for obj_id in manager._take_changes():
+                    obj = manager.get_by_id(obj_id)
+                    if obj:
+                        upserts.append((key, kind, obj_id, json.dumps(obj._dump_cache())))
+                    else:
+                        deletes.append((key, kind, obj_id))
+                connection.executemany('INSERT INTO api_objects (cache_key, kind, id, data) VALUES (?, ?, ?, ?) '
+                                       'ON CONFLICT (cache_key, kind, id) DO UPDATE SET data = excluded.data', upserts)
+                connection.executemany('DELETE FROM api_objects WHERE cache_key = ? AND kind = ? AND id = ?', deletes)
+
+    def delete_api_cache(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute('DELETE FROM api_state WHERE cache_key = ?', (key,))
+            connection.execute('DELETE FROM api_objects WHERE cache_key = ?', (key,))
+
+    def append_archive(self, key: str, entries: List[str]) -> None:
+        with self._connection() as connection:
+            connection.executemany('INSERT INTO archive (key, data) VALUES (?, ?)', [(key, entry) for entry in entries])
+            connection.execute('DELETE FROM archive WHERE key = ? AND seq <= (SELECT seq FROM archive WHERE key = ? '
+                               'ORDER BY seq DESC LIMIT 1 OFFSET ?)', (key, key, ARCHIVE_MAX_ENTRIES))
+
+    def load_archive(self, key: str) -> List[Dict[str, Any]]:
+        rows = self._connection().execute('SELECT data FROM archive WHERE key = ? ORDER BY seq DESC LIMIT ?',
+                                          (key, ARCHIVE_MAX_ENTRIES)).fetchall()
+        return [my_json.loads(data) for data, in reversed(rows)]
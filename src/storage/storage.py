@@ -0,0 +1,75 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Union
+
+from todoistapi import todoist_api
+
+API_CACHE_KINDS = ('items', 'projects', 'labels')
+# Older archive entries of a user are dropped
+ARCHIVE_MAX_ENTRIES = int(os.environ.get('TODOISTANT_ARCHIVE_MAX_ENTRIES', 200))
+
+
+class Storage(ABC):
+
+    @abstractmethod
+    def list_configs(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def load_config(self, key: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def save_config(self, key: str, data: str) -> None:
+        pass
+
+    @abstractmethod
+    def list_api_caches(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def load_api_cache(self, key: str) -> Union[None, Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def save_api_cache(self, key: str, api: 'todoist_api.TodoistAPI') -> None:
+        pass
+
+    @abstractmethod
+    def delete_api_cache(self, key: str) -> None:
+        pass
+
+    def release_api_cache(self, key: str) -> None:
+        # Called when the API loaded from the cache is unloaded
+        pass
+
+    @abstractmethod
+    def append_archive(self, key: str, entries: List[str]) -> None:
+        pass
+
+    @abstractmethod
+    def load_archive(self, key: str) -> List[Dict[str, Any]]:
+        pass
+
+
+_lock: threading.Lock = threading.Lock()
+_storage: Union[Storage, None] = None
+
+
+def create_storage(kind: str) -> Storage:
+    if kind == 'file':
+        from storage.file_storage import FileStorage
+        return FileStorage()
+    if kind == 'sqlite':
+        from storage.sqlite_storage import SqliteStorage
+        return SqliteStorage()
+    raise ValueError('Unknown storage {}'.format(kind))
+
+
+def get_storage() -> Storage:
+    global _storage
+    with _lock:
+        if _storage is None:
+            _storage = create_storage(os.environ.get('TODOISTANT_STORAGE', 'file'))
+        return _storage
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Any, Deque, Dict, Tuple, Union
+
+from utils.metrics import Metrics
+from utils.worker_pool import KeyedWorkerPool
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE: float = 30.0
+CHAT_RATE: float = 1.0
+CHAT_BURST: float = 3.0
+SENDER_WORKERS: int = 8
+MAX_QUEUED: int = 10000
+MAX_ATTEMPTS: int = 5
+# Rate limits hitting this many chats within the window are taken as the global limit
+GLOBAL_LIMIT_CHATS: int = 3
+GLOBAL_LIMIT_WINDOW: float = 5.0
+# Idle chat buckets are dropped once there are this many
+CHAT_BUCKETS_PRUNE: int = 1000
+
+
+class TelegramError(RuntimeError):
+
+    def __init__(self, description: str, retry_after: Union[int, None] = None) -> None:
+        super().__init__(description)
+        self.retry_after: Union[int, None] = retry_after
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._rate: float = rate
+        self._capacity: float = capacity
+        self._tokens: float = capacity
+        self._last: float = time.monotonic()
+        self._paused_until: float = 0.0
+
+    # Takes a token and returns how long the caller has to wait before it may be used
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    # A full bucket that is not paused behaves like a new one
+    def idle(self, now: float) -> bool:
+        with self._lock:
+            return self._tokens + (now - self._last) * self._rate >= self._capacity and self._paused_until <= now
+
+
+class OutboundSender:
+
+    def __init__(self, post: Callable[..., Any]) -> None:
+        self._post: Callable[..., Any] = post
+        self._lock: threading.Lock = threading.Lock()
+        self._global_bucket: TokenBucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._prune_at: int = CHAT_BUCKETS_PRUNE
+        self._rate_limits: Deque[Tuple[float, str]] = deque()
+        self._pool: KeyedWorkerPool = KeyedWorkerPool('telegram-sender', SENDER_WORKERS, MAX_QUEUED)
+        self.metrics: Metrics = Metrics()
+
+    def send(self, chatid: str, text: str) -> None:
+        queued_at = time.monotonic()
+        if self._pool.submit(chatid, lambda: self._deliver(chatid, text, queued_at)):
+            self.metrics.inc('queued')
+        else:
+            self.metrics.inc('dropped')
+            logger.warning('Outbound Telegram queue is full, dropping message for %s', chatid)
+
+    def _get_chat_bucket(self, chatid: str) -> TokenBucket:
+        with self._lock:
+            if chatid not in self._chat_buckets:
+                if len(self._chat_buckets) >= self._prune_at:
+                    now = time.monotonic()
+                    self._chat_buckets = {key: bucket for key, bucket in self._chat_buckets.items()
+                                          if not bucket.idle(now)}
+                    self._prune_at = max(CHAT_BUCKETS_PRUNE, 2 * len(self._chat_buckets))
+                self._chat_buckets[chatid] = TokenBucket(CHAT_RATE, CHAT_BURST)
+            return self._chat_buckets[chatid]
+
+    def _rate_limited(self, chatid: str, chat_bucket: TokenBucket, retry_after: float) -> None:
+        chat_bucket.pause(retry_after)
+        with self._lock:
+            now = time.monotonic()
+            self._rate_limits.append((now, chatid))
+            while self._rate_limits[0][0] < now - GLOBAL_LIMIT_WINDOW:
+                self._rate_limits.popleft()
+            limited_chats = len({key for _, key in self._rate_limits})
+        if limited_chats >= GLOBAL_LIMIT_CHATS:
+            # Other chats would only run into the same limit
+            self.metrics.inc('globally_rate_limited')
+            self._global_bucket.pause(retry_after)
+
+    def _deliver(self, chatid: str, text: str, queued_at: float) -> None:
+        chat_bucket = self._get_chat_bucket(chatid)
+        for _ in range(MAX_ATTEMPTS):
+            time.sleep(chat_bucket.reserve())
+            time.sleep(self._global_bucket.reserve())
+            try:
+                self._post('sendMessage', chat_id=chatid, text=text)
+            except TelegramError as e:
+                if e.retry_after:
+                    self.metrics.inc('rate_limited')
+                    self._rate_limited(chatid, chat_bucket, e.retry_after)
+                    continue
+                self.metrics.inc('failed')
+                return
+            except Exception as e:
+                logger.warning('Failed to send Telegram message', exc_info=e)
+                self.metrics.inc('failed')
+                return
+            self.metrics.inc('sent')
+            self.metrics.observe('delivery', time.monotonic() - queued_at)
+            return
+        self.metrics.inc('failed')
+
+    def get_metrics(self) -> Dict[str, Any]:
+        res = self.metrics.to_dict()
+        res['queued'] = self._pool.queued
+        res['active_chats'] = self._pool.active
+        return res
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
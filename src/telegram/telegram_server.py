@@ -2,22 +2,38 @@ import base64
 import logging
 import os
 import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Callable, Any, List, Set, Dict, cast, Collection, Union
+from typing import Callable, Any, List, Set, Dict, cast, Collection, Union, Hashable
 
 import requests
 
-import runner
 from assistants.assistants import ASSISTANTS
 from config.config import ConfigManager
+from config.runner_config import RunnerConfig
 from config.user_config import UserConfig
 from server_handlers import sync_if_necessary
+from telegram.outbound import OutboundSender, TelegramError
+from todoistapi.commit_planner import STATUS_OK
+from todoistapi.items import Item
 from utils import my_json
-from utils.utils import sync_with_retry, sort_projects
+from utils.metrics import Metrics
+from utils.utils import split_text
+from utils.worker_pool import KeyedWorkerPool
 
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGE_LENGTH: int = 4096
+KEYBOARD_CACHE_SIZE: int = 32
+ALLOWED_UPDATES: List[str] = ['message', 'callback_query']
+POLL_TIMEOUT: int = 30
+POLL_RETRY_DELAY: float = 5
+CAPTURE_COMMIT_DELAY: timedelta = timedelta(seconds=2)
+INBOUND_WORKERS: int = 8
+MAX_INBOUND_QUEUED: int = 10000
+
 
 def help(msg: str) -> Callable[[Callable], Callable]:
     def func(f: Callable) -> Callable:
@@ -43,16 +59,23 @@ class TelegramServer:
         self.should_shutdown: threading.Event = threading.Event()
         self.new_update: threading.Condition = threading.Condition()
         self.config_manager: ConfigManager = config_manager
-        self.session: requests.Session = requests.Session()
-        self.update_queue: List[Any] = []
-        self.message_queue: List[(str, str)] = []
+        self._local: threading.local = threading.local()
+        self.sender: OutboundSender = OutboundSender(self.post)
+        self.inbound: KeyedWorkerPool = KeyedWorkerPool('telegram-inbound', INBOUND_WORKERS, MAX_INBOUND_QUEUED)
+        self.metrics: Metrics = Metrics()
+        self.digests: Dict[str, (datetime, List[str])] = {}
+        self.pending_commits: Dict[str, (str, datetime)] = {}
         self.processed_updates: Set[str] = set()
         self.chat_to_user: Dict[str, str] = {}
         self.pending_registrations: Dict[str, (str, str, str, datetime)] = {}
 
         self.token: Union[str, None] = None
         self.bot_token: str = os.environ['TELEGRAM_TOKEN']
-        assert os.environ['TELEGRAM_WEBHOOK']
+        self.api_url: str = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+        self.polling: bool = os.environ.get('TELEGRAM_MODE', 'webhook') == 'polling'
+        self.update_offset: int = 0
+        if not self.polling:
+            assert os.environ['TELEGRAM_WEBHOOK']
 
         self.commands: Dict[str, Callable] = {
             '/hi': self.cmd_say_hi,
@@ -69,13 +92,20 @@ class TelegramServer:
     def _get_user_for_message(self, message: Any) -> UserConfig:
         return UserConfig.get(self.config_manager, self.chat_to_user[message['chat']['id']])
 
-    def post(self, method: str, **data) -> Any:
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def post(self, method: str, request_timeout: Union[float, None] = None, **data) -> Any:
         if not data:
             data = {}
-        res = self.session.post('https://api.telegram.org/bot{}/{}'.format(self.bot_token, method), json=data).json()
+        res = self.session.post('{}/bot{}/{}'.format(self.api_url, self.bot_token, method), json=data,
+                                timeout=request_timeout).json()
         if not res['ok']:
             logger.warning('Error: %s', res['description'])
-            raise RuntimeError()
+            raise TelegramError(res['description'], res.get('parameters', {}).get('retry_after'))
         return res['result']
 
     def reply(self, message: Any, text: str) -> None:
@@ -95,42 +125,76 @@ class TelegramServer:
                       'inline_keyboard': buttons
                   })
 
+    @staticmethod
+    def last_task(user: UserConfig) -> Union[Item, None]:
+        task = cast(Union[Item, None], user.tmp.get('telegram_last_task'))
+        if task is None and 'telegram_last_task_id' in user.tmp:
+            # The API was hibernated since the task was added
+            task = user.api.items.get_by_id(cast(str, user.tmp.pop('telegram_last_task_id')))
+            if task:
+                user.tmp['telegram_last_task'] = task
+        return task
+
     def buttons_in_rows(self, buttons: List[Any], rows: int) -> List[Any]:
         inline_keyboard = []
         for i in range(0, len(buttons) + rows - 1, rows):
             inline_keyboard.append(buttons[i:i + rows])
         return inline_keyboard
 
+    def cached_keyboard(self, user: UserConfig, key: Hashable, build: Callable[[], List[Any]]) -> List[Any]:
+        cache = user.tmp.get('telegram_keyboards')
+        if not cache or cache['api'] is not user.api:
+            cache = {'api': user.api, 'keyboards': OrderedDict()}
+            user.tmp['telegram_keyboards'] = cache
+        keyboards = cache['keyboards']
+        if key in keyboards:
+            keyboards.move_to_end(key)
+            return keyboards[key]
+        keyboard = build()
+        keyboards[key] = keyboard
+        if len(keyboards) > KEYBOARD_CACHE_SIZE:
+            keyboards.popitem(last=False)
+        return keyboard
+
     def create_project_buttons(self, user: UserConfig, cmd: str) -> List[Any]:
         sync_if_necessary(user)
-        project_buttons = [
-            {
-                'text': project.name,
-                'callback_data': my_json.dumps({
-                    'cmd': cmd,
-                    'project': project.id,
-                }),
-            } for project in sort_projects(user.api.projects)]
-        return self.buttons_in_rows(project_buttons, 2)
+
+        def build() -> List[Any]:
+            project_buttons = [
+                {
+                    'text': project.name,
+                    'callback_data': my_json.dumps({
+                        'cmd': cmd,
+                        'project': project.id,
+                    }),
+                } for project in user.api.projects.sorted()]
+            return self.buttons_in_rows(project_buttons, 2)
+
+        return self.cached_keyboard(user, ('projects', cmd, user.api.projects.version), build)
 
     def create_label_buttons(self, user: UserConfig, cmd: str, active: Collection[str]) -> List[Any]:
         sync_if_necessary(user)
-        label_buttons = [
-            {
-                'text': '{} (on)'.format(label.name) if label.name in active else label.name,
+        active = frozenset(active)
+
+        def build() -> List[Any]:
+            label_buttons = [
+                {
+                    'text': '{} (on)'.format(label.name) if label.name in active else label.name,
+                    'callback_data': my_json.dumps({
+                        'cmd': cmd,
+                        'label': label.name,
+                    }),
+                } for label in user.api.labels]
+            label_buttons.append({
+                'text': 'Finish.',
                 'callback_data': my_json.dumps({
                     'cmd': cmd,
-                    'label': label.name,
+                    'label': -1,
                 }),
-            } for label in user.api.labels]
-        label_buttons.append({
-            'text': 'Finish.',
-            'callback_data': my_json.dumps({
-                'cmd': cmd,
-                'label': -1,
-            }),
-        })
-        return self.buttons_in_rows(label_buttons, 2)
+            })
+            return self.buttons_in_rows(label_buttons, 2)
+
+        return self.cached_keyboard(user, ('labels', cmd, user.api.labels.version, active), build)
 
     def default_expired(self, user: UserConfig) -> bool:
         return 'telegram_default_timestamp' not in user.tmp or (
@@ -172,7 +236,7 @@ class TelegramServer:
     @require_register
     def cmd_project(self, message: Any) -> None:
         with self._get_user_for_message(message) as user:
-            if 'telegram_last_task' not in user.tmp:
+            if not self.last_task(user):
                 return self.reply(message, 'No task was added so far.')
             self.reply_keyboard(message, 'Choose project:', self.create_project_buttons(user, 'project'))
 
@@ -187,10 +251,11 @@ class TelegramServer:
     @require_register
     def cmd_labels(self, message: Any) -> None:
         with self._get_user_for_message(message) as user:
-            if 'telegram_last_task' not in user.tmp:
+            last_task = self.last_task(user)
+            if not last_task:
                 return self.reply(message, 'No task was added so far.')
             self.reply_keyboard(message, 'Choose labels:',
-                                self.create_label_buttons(user, 'labels', user.tmp['telegram_last_task'].labels))
+                                self.create_label_buttons(user, 'labels', last_task.labels))
 
     @help('Change the default labels')
     @require_register
@@ -216,15 +281,21 @@ class TelegramServer:
         with self._get_user_for_message(message) as user:
             if not user.acfg(ASSISTANTS.templates).enabled:
                 return self.reply(message, 'Templates are not enabled.')
-            my_templates = ASSISTANTS.templates.get_templates(user)
-            template_buttons = [{
-                'text': template.name,
-                'callback_data': my_json.dumps({
-                    'cmd': 'template',
-                    'template': template.id,
-                })
-            } for template in my_templates]
-            self.reply_keyboard(message, 'Choose template:', self.buttons_in_rows(template_buttons, 2))
+
+            def build() -> List[Any]:
+                template_buttons = [{
+                    'text': template.name,
+                    'callback_data': my_json.dumps({
+                        'cmd': 'template',
+                        'template': template.id,
+                    })
+                } for template in ASSISTANTS.templates.get_templates(user)]
+                return self.buttons_in_rows(template_buttons, 2)
+
+            # Templates are only looked up again after items changed
+            src_project = user.acfg(ASSISTANTS.templates).get('src_project')
+            self.reply_keyboard(message, 'Choose template:',
+                                self.cached_keyboard(user, ('templates', user.api.items.version, src_project), build))
 
     def handle_normal_message(self, message: Any) -> None:
         chatid = message['chat']['id']
@@ -245,7 +316,6 @@ class TelegramServer:
                 if kind + '_project' not in cfg:
                     self.reply(message, 'Sorry, I don\'t know how to handle this type of message.')
                     return
-                sync_with_retry(user)
 
                 project_id = cfg[kind + '_project']
                 labels = cfg[kind + '_labels']
@@ -258,10 +328,13 @@ class TelegramServer:
                     project_id=project_id,
                     labels=labels[:],
                     due={'string': 'today'})
-                user.api.commit()
-                runner.run_now(ASSISTANTS.priosorter, user, self.config_manager)
                 user.tmp['telegram_last_task'] = new_task
-                self.reply(message, 'Added task.')
+                user.tmp.pop('telegram_last_task_id', None)
+                # Reported by commit_captured if the task can not be created
+                user.tmp.setdefault('telegram_captured', []).append((new_task.id, new_task.content))
+                self.schedule_commit(chatid, userid)
+                with self.metrics.time('reply'):
+                    self.reply(message, 'Added task.')
 
         if 'forward_from' in message or 'forward_sender_name' in message:
             if 'forward_from' in message:
@@ -277,7 +350,8 @@ class TelegramServer:
             handle_message('link')
         else:
             handle_message('plain')
-        self.post('deleteMessage', chat_id=chatid, message_id=message['message_id'])
+        with self.metrics.time('delete'):
+            self.post('deleteMessage', chat_id=chatid, message_id=message['message_id'])
 
     def process(self, message: Any) -> None:
         if message['chat']['type'] != 'private':
@@ -309,24 +383,26 @@ class TelegramServer:
             return
         if data['cmd'] == 'project':
             with UserConfig.get(self.config_manager, userid) as user:
-                if 'telegram_last_task' not in user.tmp:
+                last_task = self.last_task(user)
+                if not last_task:
                     return
-                user.tmp['telegram_last_task'].move(project_id=data['project'])
+                last_task.move(project_id=data['project'])
                 user.api.commit()
             self.change_reply(message, 'Task moved.')
         elif data['cmd'] == 'labels':
             with UserConfig.get(self.config_manager, userid) as user:
-                if 'telegram_last_task' not in user.tmp:
+                last_task = self.last_task(user)
+                if not last_task:
                     return
                 if data['label'] == -1:
                     self.change_reply(message, 'Done.')
                 else:
-                    labels = user.tmp['telegram_last_task'].labels[:]
+                    labels = last_task.labels[:]
                     if data['label'] in labels:
                         labels.remove(data['label'])
                     else:
                         labels.append(data['label'])
-                    user.tmp['telegram_last_task'].labels = labels
+                    last_task.labels = labels
                     user.api.commit()
                     self.change_keyboard(message, 'Choose labels:', self.create_label_buttons(user, 'labels', labels))
         elif data['cmd'] == 'default_project':
@@ -362,11 +438,17 @@ class TelegramServer:
 
     def run_forever(self) -> None:
         self.token = base64.urlsafe_b64encode(os.urandom(32)).decode()
-        webhook = os.environ['TELEGRAM_WEBHOOK']
-        if not webhook.endswith('/'):
-            webhook += '/'
-        webhook += 'hook/' + self.token
-        self.post('setWebhook', url=webhook, max_connections=4, allowed_updates=['message', 'callback_query'])
+        if self.polling:
+            self.post('deleteWebhook')
+            poll_thread = threading.Thread(target=self.poll_forever)
+            poll_thread.daemon = True
+            poll_thread.start()
+        else:
+            webhook = os.environ['TELEGRAM_WEBHOOK']
+            if not webhook.endswith('/'):
+                webhook += '/'
+            webhook += 'hook/' + self.token
+            self.post('setWebhook', url=webhook, max_connections=4, allowed_updates=ALLOWED_UPDATES)
         self.post('setMyCommands', commands=[{
             'command': cmd,
             'description': func.__description__,
@@ -374,42 +456,126 @@ class TelegramServer:
         self.should_shutdown.clear()
         with self.new_update:
             while not self.should_shutdown.is_set():
-                while self.update_queue:
-                    update = self.update_queue.pop()
-                    if update['update_id'] in self.processed_updates:
-                        continue
-                    self.processed_updates.add(update['update_id'])
-                    if 'message' in update:
-                        try:
-                            self.process(update['message'])
-                        except RuntimeError:
-                            pass
-                    elif 'callback_query' in update:
-                        try:
-                            self.process_inline(update['callback_query'])
-                        except RuntimeError:
-                            pass
-                while self.message_queue:
-                    chatid, text = self.message_queue.pop()
-                    try:
-                        self.post('sendMessage', chat_id=chatid, text=text)
-                    except RuntimeError:
-                        pass
-                self.new_update.wait(60)
+                self.flush_digests()
+                self.flush_commits()
+                self.new_update.wait(self.get_wait_time(60))
+
+    def poll_forever(self) -> None:
+        while not self.should_shutdown.is_set():
+            try:
+                with self.metrics.time('get_updates'):
+                    updates = self.post('getUpdates', request_timeout=POLL_TIMEOUT + 10, offset=self.update_offset,
+                                        timeout=POLL_TIMEOUT, allowed_updates=ALLOWED_UPDATES)
+            except (RuntimeError, requests.RequestException, ValueError) as e:
+                logger.warning('Failed to get Telegram updates', exc_info=e)
+                self.should_shutdown.wait(POLL_RETRY_DELAY)
+                continue
+            for update in updates:
+                self.update_offset = max(self.update_offset, update['update_id'] + 1)
+                self.dispatch(update)
+
+    def dispatch(self, update: Any) -> None:
+        with self.new_update:
+            if update['update_id'] in self.processed_updates:
+                return
+            self.processed_updates.add(update['update_id'])
+        if 'message' in update:
+            chatid = update['message']['chat']['id']
+        elif 'callback_query' in update:
+            chatid = update['callback_query']['message']['chat']['id']
+        else:
+            return
+        received_at = time.monotonic()
+        if not self.inbound.submit(chatid, lambda: self.handle_update(update, received_at)):
+            self.metrics.inc('inbound_dropped')
+            logger.warning('Inbound Telegram queue is full, dropping update %s', update['update_id'])
+
+    def handle_update(self, update: Any, received_at: float) -> None:
+        self.metrics.observe('queue_wait', time.monotonic() - received_at)
+        message = update['message'] if 'message' in update else update['callback_query']['message']
+        userid = self.chat_to_user.get(message['chat']['id'])
+        if userid is not None:
+            with UserConfig.get(self.config_manager, userid) as user:
+                user.mark_active()
+        if 'message' in update:
+            try:
+                with self.metrics.time('message'):
+                    self.process(update['message'])
+            except RuntimeError:
+                pass
+        elif 'callback_query' in update:
+            try:
+                with self.metrics.time('callback_query'):
+                    self.process_inline(update['callback_query'])
+            except RuntimeError:
+                pass
+
+    def flush_digests(self) -> None:
+        now = datetime.utcnow()
+        for chatid in list(self.digests):
+            deadline, texts = self.digests[chatid]
+            if deadline <= now:
+                del self.digests[chatid]
+                for part in split_text('\n'.join(texts), MAX_MESSAGE_LENGTH):
+                    if part.strip():
+                        self.sender.send(chatid, part)
+
+    def schedule_commit(self, chatid: str, userid: str) -> None:
+        with self.new_update:
+            if userid not in self.pending_commits:
+                self.pending_commits[userid] = (chatid, datetime.utcnow() + CAPTURE_COMMIT_DELAY)
+                self.new_update.notify_all()
+
+    def flush_commits(self) -> None:
+        now = datetime.utcnow()
+        for userid in list(self.pending_commits):
+            chatid, deadline = self.pending_commits[userid]
+            if deadline <= now:
+                del self.pending_commits[userid]
+                # Run on the chat's worker so the commit is ordered with the chat's other messages
+                self.inbound.submit(chatid, lambda chatid=chatid, userid=userid: self.commit_captured(chatid, userid))
+
+    def commit_captured(self, chatid: str, userid: str) -> None:
+        with UserConfig.get(self.config_manager, userid) as user:
+            with self.metrics.time('commit'):
+                result = user.api.commit()
+            # Tasks committed in between by someone else have no status here
+            failed = [content for temp_id, content in user.tmp.pop('telegram_captured', [])
+                      if result.temp_id_status(temp_id) not in (None, STATUS_OK)]
+            last_task = user.tmp.get('telegram_last_task')
+            if last_task is not None and result.temp_id_status(last_task.id) not in (None, STATUS_OK):
+                user.tmp.pop('telegram_last_task')
+            if failed:
+                self.sender.send(chatid, 'Could not add task:\n' + '\n'.join(failed))
+            priosorter_cfg = user.acfg(ASSISTANTS.priosorter)
+            if priosorter_cfg.enabled:
+                priosorter_cfg.next_run = datetime.utcnow()
+        with RunnerConfig.get(self.config_manager) as runner_cfg:
+            my_runner = runner_cfg.runner
+        my_runner.wake()
+
+    def get_wait_time(self, default: float) -> float:
+        deadlines = [deadline for deadline, _ in self.digests.values()]
+        deadlines += [deadline for _, deadline in self.pending_commits.values()]
+        if not deadlines:
+            return default
+        return max(0.0, min(default, (min(deadlines) - datetime.utcnow()).total_seconds()))
 
     def receive(self, token: str, update: Any):
         if token != self.token:
             logger.warning('Received bad token')
             return
-        with self.new_update:
-            self.update_queue.append(update)
-            self.new_update.notify_all()
+        self.dispatch(update)
 
-    def send_message(self, receiver: str, text: str) -> None:
+    def send_message(self, receiver: str, text: str, digest_window: int = 0) -> None:
         if not receiver:
             return
+        if digest_window <= 0:
+            self.sender.send(receiver, text)
+            return
         with self.new_update:
-            self.message_queue.append((receiver, text))
+            deadline = datetime.utcnow() + timedelta(seconds=digest_window)
+            self.digests.setdefault(receiver, (deadline, []))[1].append(text)
             self.new_update.notify_all()
 
     def finish_register(self, account: str, code: str) -> str:
@@ -426,12 +592,21 @@ class TelegramServer:
             cfg['chatid'] = chatid
             cfg['username'] = username
         self.chat_to_user[chatid] = userid
-        with self.new_update:
-            self.message_queue.append((chatid, 'Successfully connected account!'))
-            self.new_update.notify_all()
+        self.sender.send(chatid, 'Successfully connected account!')
         return 'ok'
 
+    def get_metrics(self) -> Dict[str, Any]:
+        inbound = self.metrics.to_dict()
+        inbound['queued'] = self.inbound.queued
+        inbound['active_chats'] = self.inbound.active
+        return {
+            'inbound': inbound,
+            'outbound': self.sender.get_metrics(),
+        }
+
     def shutdown(self) -> None:
         self.should_shutdown.set()
         with self.new_update:
             self.new_update.notify_all()
+        self.inbound.shutdown()
+        self.sender.shutdown()
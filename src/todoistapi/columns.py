@@ -0,0 +1,151 @@
+import math
+import os
+from datetime import date, datetime, timezone
+from typing import Dict, List, Union
+
+from todoistapi import items as items_mod
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Accounts with fewer items are filtered item by item, which is fast enough and avoids keeping the columns
+COLUMNS_MIN_ITEMS = int(os.environ.get('TODOISTANT_COLUMNS_MIN_ITEMS', 2000))
+
+NO_DAY = 0
+NO_KEY = -1
+
+
+def available() -> bool:
+    return numpy is not None
+
+
+class ItemColumns:
+
+    def __init__(self, manager: 'items_mod.ItemManager') -> None:
+        self._manager: items_mod.ItemManager = manager
+        self._objects: List[items_mod.Item] = []
+        # Keyed by object identity, as temporary ids are replaced after a commit
+        self._rows: Dict[int, int] = {}
+        self._projects: Dict[str, int] = {}
+        self._parents: Dict[str, int] = {}
+        self._label_bits: Dict[str, int] = {}
+        self._tz_info: object = None
+        self._capacity: int = 0
+        self.due_day: numpy.ndarray = numpy.zeros(0, numpy.int32)
+        self.due_time: numpy.ndarray = numpy.zeros(0, numpy.float64)
+        self.checked: numpy.ndarray = numpy.zeros(0, numpy.bool_)
+        self.deleted: numpy.ndarray = numpy.zeros(0, numpy.bool_)
+        self.priority: numpy.ndarray = numpy.zeros(0, numpy.int8)
+        self.project: numpy.ndarray = numpy.zeros(0, numpy.int32)
+        self.parent: numpy.ndarray = numpy.zeros(0, numpy.int32)
+        self.labels: numpy.ndarray = numpy.zeros((0, 1), numpy.uint64)
+        manager.add_listener(self._items_changed)
+        self._refresh()
+
+    def detach(self) -> None:
+        self._manager.remove_listener(self._items_changed)
+
+    def _grow(self, size: int) -> None:
+        capacity = max(size, self._capacity * 2, 1024)
+
+        def grown(column: numpy.ndarray, fill: object) -> numpy.ndarray:
+            res = numpy.full((capacity,) + column.shape[1:], fill, column.dtype)
+            res[:len(column)] = column
+            return res
+
+        self.due_day = grown(self.due_day, NO_DAY)
+        self.due_time = grown(self.due_time, math.nan)
+        self.checked = grown(self.checked, False)
+        self.deleted = grown(self.deleted, False)
+        self.priority = grown(self.priority, 0)
+        self.project = grown(self.project, NO_KEY)
+        self.parent = grown(self.parent, NO_KEY)
+        self.labels = grown(self.labels, 0)
+        self._capacity = capacity
+
+    def _label_bit(self, label: str) -> int:
+        bit = self._label_bits.get(label)
+        if bit is None:
+            bit = len(self._label_bits)
+            self._label_bits[label] = bit
+            if bit >= self.labels.shape[1] * 64:
+                self.labels = numpy.hstack([self.labels, numpy.zeros((len(self.labels), 1), numpy.uint64)])
+        return bit
+
+    def _set_row(self, row: int, item: 'items_mod.Item') -> None:
+        due = item.due
+        due_date = due.date
+        self.due_day[row] = due.parsed_day.toordinal() if due_date else NO_DAY
+        self.due_time[row] = due.parsed_datetime_utc.replace(tzinfo=timezone.utc).timestamp() \
+            if due_date and 'T' in due_date and self._tz_info else math.nan
+        self.checked[row] = item.checked
+        self.deleted[row] = item.is_deleted
+        self.priority[row] = item.priority
+        self.project[row] = self._projects.setdefault(item.project_id, len(self._projects)) \
+            if item.project_id else NO_KEY
+        self.parent[row] = self._parents.setdefault(item.parent_id, len(self._parents)) \
+            if item.parent_id else NO_KEY
+        self.labels[row] = 0
+        for label in item.labels:
+            bit = self._label_bit(label)
+            self.labels[row, bit // 64] |= numpy.uint64(1 << (bit % 64))
+
+    def _update_items(self, items: List['items_mod.Item']) -> None:
+        for item in items:
+            row = self._rows.get(id(item))
+            if row is None:
+                row = len(self._objects)
+                if row >= self._capacity:
+                    self._grow(row + 1)
+                self._objects.append(item)
+                self._rows[id(item)] = row
+            self._set_row(row, item)
+
+    def _items_changed(self, items: List['items_mod.Item']) -> None:
+        self._update_items(items)
+
+    def _refresh(self) -> None:
+        # Timestamps of timed due dates depend on the timezone of the user
+        tz_info = self._manager._api.user.tz_info
+        if tz_info != self._tz_info:
+            self._tz_info = dict(tz_info) if tz_info else None
+            self._update_items(list(self._manager))
+        # Items added locally do not notify listeners
+        elif len(self._manager) != len(self._objects):
+            self._update_items([item for item in self._manager if id(item) not in self._rows])
+
+    def select(self, checked: Union[None, bool] = None, deleted: Union[None, bool] = None, label: str = None,
+               project_id: str = None, parent_id: str = None, top_level: bool = False, priority: int = None,
+               due_on: date = None, due_before: date = None,
+               due_time_before: datetime = None) -> List['items_mod.Item']:
+        self._refresh()
+        count = len(self._objects)
+        mask = numpy.ones(count, numpy.bool_)
+        if checked is not None:
+            mask &= self.checked[:count] == checked
+        if deleted is not None:
+            mask &= self.deleted[:count] == deleted
+        if label is not None:
+            bit = self._label_bits.get(label)
+            if bit is None:
+                return []
+            mask &= (self.labels[:count, bit // 64] & numpy.uint64(1 << (bit % 64))) != 0
+        if project_id is not None:
+            mask &= self.project[:count] == self._projects.get(project_id, -2)
+        if parent_id is not None:
+            mask &= self.parent[:count] == self._parents.get(parent_id, -2)
+        if top_level:
+            mask &= self.parent[:count] == NO_KEY
+        if priority is not None:
+            mask &= self.priority[:count] == priority
+        if due_on is not None:
+            mask &= self.due_day[:count] == due_on.toordinal()
+        if due_before is not None:
+            mask &= (self.due_day[:count] != NO_DAY) & (self.due_day[:count] < due_before.toordinal())
+        if due_time_before is not None:
+            # Comparisons with NaN are false, so items without a due time are excluded
+            mask &= self.due_time[:count] < due_time_before.replace(tzinfo=timezone.utc).timestamp()
+        objects = self._objects
+        return [objects[row] for row in numpy.flatnonzero(mask)]
@@ -0,0 +1,129 @@
+import heapq
+from typing import Any, Dict, List, Set, Union
+
+# Maximum number of commands the Sync API accepts per request
+COMMAND_LIMIT = 100
+
+STATUS_OK = 'ok'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+
+
+def referenced_ids(value: Any, ids: Set[str]) -> Set[str]:
+    # Ids can appear as argument values, in lists and as keys, e.g. in item_update_day_orders
+    res = set()
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            if value in ids:
+                res.add(value)
+        elif isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return res
+
+
+def replace_ids(value: Any, mapping: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, dict):
+        return {replace_ids(key, mapping): replace_ids(x, mapping) for key, x in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(replace_ids(x, mapping) for x in value)
+    return value
+
+
+class CommitPlan:
+
+    def __init__(self, commands: List[Dict[str, Any]], limit: int = COMMAND_LIMIT) -> None:
+        temp_ids = {command['temp_id']: i for i, command in enumerate(commands) if 'temp_id' in command}
+        self.depends: List[Set[str]] = [
+            referenced_ids(command['args'], temp_ids.keys()) - {command.get('temp_id')} for command in commands]
+
+        # Commands are sent in queue order, unless they refer to a temporary id of a later command
+        dependents: Dict[int, List[int]] = {}
+        waiting = []
+        for i, depends in enumerate(self.depends):
+            waiting.append(len(depends))
+            for temp_id in depends:
+                dependents.setdefault(temp_ids[temp_id], []).append(i)
+        ready = [i for i, count in enumerate(waiting) if not count]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            i = heapq.heappop(ready)
+            order.append(i)
+            for dependent in dependents.get(i, []):
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    heapq.heappush(ready, dependent)
+        if len(order) < len(commands):
+            # Circular references can not be resolved by ordering, they are sent as queued
+            planned = set(order)
+            order.extend(i for i in range(len(commands)) if i not in planned)
+
+        # Commands linked by temporary ids or acting on the same object form a group, which is kept in one chunk where
+        # it fits, so a failed chunk never leaves a partially created group behind
+        groups = list(range(len(commands)))
+
+        def find(i: int) -> int:
+            while groups[i] != i:
+                groups[i] = groups[groups[i]]
+                i = groups[i]
+            return i
+
+        by_object: Dict[str, int] = {}
+        for i, command in enumerate(commands):
+            for temp_id in self.depends[i]:
+                groups[find(i)] = find(temp_ids[temp_id])
+            object_id = command['args'].get('id') if isinstance(command['args'], dict) else None
+            if isinstance(object_id, str):
+                if object_id in by_object:
+                    groups[find(i)] = find(by_object[object_id])
+                by_object.setdefault(object_id, i)
+        members: Dict[int, List[int]] = {}
+        for i in order:
+            members.setdefault(find(i), []).append(i)
+
+        chunks: List[List[int]] = []
+        for group in members.values():
+            if len(group) > limit:
+                # Only groups larger than a request are split, in dependency order
+                chunks.extend(group[start:start + limit] for start in range(0, len(group), limit))
+                continue
+            for chunk in chunks:
+                if len(chunk) + len(group) <= limit:
+                    chunk.extend(group)
+                    break
+            else:
+                chunks.append(list(group))
+        position = {i: pos for pos, i in enumerate(order)}
+        self.commands: List[Dict[str, Any]] = commands
+        self.chunks: List[List[int]] = [sorted(chunk, key=position.__getitem__) for chunk in chunks]
+
+
+class CommitResult:
+
+    def __init__(self) -> None:
+        # Status per command uuid, either STATUS_OK, STATUS_SKIPPED, STATUS_FAILED or the error returned by Todoist
+        self.status: Dict[str, Union[str, Dict[str, Any]]] = {}
+        self._by_temp_id: Dict[str, str] = {}
+        self.round_trips: int = 0
+
+    def set_status(self, command: Dict[str, Any], status: Union[str, Dict[str, Any]]) -> None:
+        self.status[command['uuid']] = status
+        if 'temp_id' in command:
+            self._by_temp_id[command['temp_id']] = command['uuid']
+
+    def temp_id_status(self, temp_id: str) -> Union[None, str, Dict[str, Any]]:
+        command_uuid = self._by_temp_id.get(temp_id)
+        return self.status.get(command_uuid) if command_uuid else None
+
+    def ok(self) -> bool:
+        return all(status == STATUS_OK for status in self.status.values())
+
+    def failed(self) -> List[str]:
+        return [command_uuid for command_uuid, status in self.status.items() if status != STATUS_OK]
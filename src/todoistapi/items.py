@@ -1,6 +1,7 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Type, Dict, Any, List, Union
 
+from todoistapi import columns, todoist_api
 from todoistapi.mixins import ByIdManager, ApiObject
 from utils.utils import local_to_utc
 
@@ -8,6 +9,10 @@ from utils.utils import local_to_utc
 # noinspection PyProtectedMember
 class ItemManager(ByIdManager['Item']):
 
+    def __init__(self, api: 'todoist_api.TodoistAPI'):
+        super().__init__(api)
+        self._columns: Union[None, columns.ItemColumns] = None
+
     def get_managed_type(self) -> Type:
         return Item
 
@@ -18,14 +23,74 @@ class ItemManager(ByIdManager['Item']):
         data['id'] = new_id
         new_item = Item(self._api, data)
         self._by_id[new_id] = new_item
+        self._mark_changed(new_id)
+        self.version += 1
         return new_item
 
+    def _remove(self, id: str) -> None:
+        super()._remove(id)
+        # Rows are never removed from the columns, they are built again on the next query
+        if self._columns is not None:
+            self._columns.detach()
+            self._columns = None
+
+    def get_columns(self) -> Union[None, columns.ItemColumns]:
+        if self._columns is None and columns.available() and len(self) >= columns.COLUMNS_MIN_ITEMS:
+            self._columns = columns.ItemColumns(self)
+        return self._columns
+
+    def select(self, checked: Union[None, bool] = None, deleted: Union[None, bool] = None, label: str = None,
+               project_id: str = None, parent_id: str = None, top_level: bool = False, priority: int = None,
+               due_on: date = None, due_before: date = None, due_time_before: datetime = None) -> List['Item']:
+        item_columns = self.get_columns()
+        if item_columns is not None:
+            return item_columns.select(checked, deleted, label, project_id, parent_id, top_level, priority, due_on,
+                                       due_before, due_time_before)
+        res = []
+        for item in self:
+            if checked is not None and item.checked != checked:
+                continue
+            if deleted is not None and item.is_deleted != deleted:
+                continue
+            if label is not None and label not in item.labels:
+                continue
+            if project_id is not None and item.project_id != project_id:
+                continue
+            if parent_id is not None and item.parent_id != parent_id:
+                continue
+            if top_level and item.parent_id:
+                continue
+            if priority is not None and item.priority != priority:
+                continue
+            if due_on is not None or due_before is not None:
+                day = item.due.parsed_day
+                if not day:
+                    continue
+                if due_on is not None and day.date() != due_on:
+                    continue
+                if due_before is not None and day.date() >= due_before:
+                    continue
+            if due_time_before is not None:
+                due_date = item.due.date
+                if not due_date or 'T' not in due_date or not self._api.user.tz_info \
+                        or item.due.parsed_datetime_utc >= due_time_before:
+                    continue
+            res.append(item)
+        return res
+
     def update_day_orders(self, new_orders: Dict[str, int]) -> None:
         self._api._enqueue_command('item_update_day_orders', {'ids_to_orders': new_orders})
 
 
 # noinspection PyProtectedMember
 class Item(ApiObject):
+    __slots__ = ()
+
+    retained_fields = frozenset({
+        'id', 'content', 'due', 'checked', 'is_deleted', 'completed_at', 'priority', 'labels', 'day_order',
+        'child_order', 'parent_id', 'project_id', 'section_id',
+    })
+    interned_fields = frozenset({'project_id', 'section_id', 'parent_id', 'labels'})
 
     @property
     def content(self) -> str:
@@ -43,6 +108,10 @@ class Item(ApiObject):
     def checked(self) -> bool:
         return self._data.get('checked', False)
 
+    @property
+    def is_deleted(self) -> bool:
+        return self._data.get('is_deleted', False)
+
     @property
     def completed_at(self) -> Union[None, str]:
         return self._data.get('completed_at')
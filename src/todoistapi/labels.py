@@ -1,24 +1,52 @@
-from typing import Type, Union
+from typing import Type, Union, Dict
 
+from todoistapi import todoist_api
 from todoistapi.mixins import ByIdManager, ApiObject
 
+PRIORITY_PREFIX: str = 'prio'
+
 
 # noinspection PyProtectedMember
 class LabelManager(ByIdManager['Label']):
 
+    def __init__(self, api: 'todoist_api.TodoistAPI'):
+        super().__init__(api)
+        self._by_name: Dict[str, Label] = {}
+        self.priorities: Dict[str, int] = {}
+
     def get_managed_type(self) -> Type:
         return Label
 
+    def _index(self, label: 'Label') -> None:
+        if label.is_deleted or not label.name:
+            return
+        self._by_name[label.name] = label
+        if label.name.startswith(PRIORITY_PREFIX):
+            try:
+                self.priorities[label.name] = int(label.name[len(PRIORITY_PREFIX):])
+            except ValueError:
+                pass
+
+    def _unindex(self, label: 'Label') -> None:
+        if self._by_name.get(label.name) is label:
+            del self._by_name[label.name]
+            self.priorities.pop(label.name, None)
+
     def get_by_name(self, name: str) -> Union[None, 'Label']:
-        for label in self:
-            if label.name == name:
-                return label
-        return None
+        return self._by_name.get(name)
 
 
 # noinspection PyProtectedMember
 class Label(ApiObject):
+    __slots__ = ()
+
+    retained_fields = frozenset({'id', 'name', 'is_deleted'})
+    interned_fields = frozenset({'name'})
 
     @property
     def name(self) -> str:
         return self._data.get('name')
+
+    @property
+    def is_deleted(self) -> bool:
+        return self._data.get('is_deleted', False)
@@ -1,10 +1,14 @@
+import os
+import sys
 from abc import ABC, abstractmethod
-from typing import TypeVar, Generic, Dict, List, Any, Type, Iterator, Union
+from typing import TypeVar, Generic, Dict, List, Any, Type, Iterator, Union, Callable, Set, ClassVar, FrozenSet
 
-from todoistapi import todoist_api
+from todoistapi import snapshot, todoist_api
 
 T = TypeVar('T', bound='ApiObject')
 
+RETAIN_ALL_FIELDS = os.environ.get('TODOISTANT_RETAIN_ALL_FIELDS', '0') == '1'
+
 
 # noinspection PyProtectedMember
 class ByIdManager(ABC, Generic[T]):
@@ -12,46 +16,152 @@ class ByIdManager(ABC, Generic[T]):
     def __init__(self, api: 'todoist_api.TodoistAPI'):
         self._api: 'todoist_api.TodoistAPI' = api
         self._by_id: Dict[str, T] = {}
+        self._listeners: List[Callable[[List[T]], None]] = []
+        self.version: int = 0
+        self._changed: Set[str] = set()
 
     @abstractmethod
     def get_managed_type(self) -> Type:
         pass
 
+    def add_listener(self, listener: Callable[[List[T]], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[List[T]], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
     def _update(self, new_items: List[Any], temp_id_mapping: Dict[str, str] = None) -> None:
+        updated = []
         if temp_id_mapping:
             for key in temp_id_mapping:
                 if key in self._by_id:
-                    self._by_id[key]._data['id'] = temp_id_mapping[key]
-                    self._by_id[temp_id_mapping[key]] = self._by_id[key]
-                    del self._by_id[key]
-        if not new_items:
+                    obj = self._by_id.pop(key)
+                    self._unindex(obj)
+                    obj._data['id'] = temp_id_mapping[key]
+                    self._by_id[temp_id_mapping[key]] = obj
+                    self._index(obj)
+                    self._changed.add(key)
+                    self._changed.add(obj.id)
+                    updated.append(obj)
+        for item in new_items or []:
+            obj = self._by_id.get(item['id'])
+            if obj is None:
+                obj = self.get_managed_type()(self._api)
+                self._by_id[item['id']] = obj
+            else:
+                self._unindex(obj)
+            obj._update(item)
+            self._index(obj)
+            self._changed.add(obj.id)
+            updated.append(obj)
+        if updated:
+            self.version += 1
+            for listener in self._listeners:
+                listener(updated)
+
+    def _remove(self, id: str) -> None:
+        obj = self._by_id.pop(id, None)
+        if obj is None:
             return
-        for item in new_items:
-            self._by_id.setdefault(item['id'], self.get_managed_type()(self._api))._update(item)
+        self._unindex(obj)
+        self._changed.add(id)
+        self.version += 1
+
+    def _index(self, obj: T) -> None:
+        pass
+
+    def _unindex(self, obj: T) -> None:
+        pass
+
+    def _mark_changed(self, id: str) -> None:
+        self._changed.add(id)
+
+    def _take_changes(self) -> Set[str]:
+        changed, self._changed = self._changed, set()
+        return changed
 
     def _dump_cache(self) -> List[Dict[str, Any]]:
         return [
             item._dump_cache() for item in self
         ]
 
-    def _load_cache(self, data: List[Dict[str, Any]]) -> None:
-        self._update(data)
+    def _load_cache(self, data: Union[List[Dict[str, Any]], snapshot.LazyRecords]) -> None:
+        if not isinstance(data, snapshot.LazyRecords):
+            self._update(data)
+            return
+        # Objects are only decoded when used. Indexes, listeners like the item columns and views over all items decode
+        # what they cover, so this mostly saves decoding items of small accounts nothing iterates over.
+        loaded = []
+        for obj_id, decode in data:
+            obj = self.get_managed_type().lazy(self._api, decode)
+            self._by_id[obj_id] = obj
+            self._index(obj)
+            loaded.append(obj)
+        if loaded:
+            self.version += 1
+            for listener in self._listeners:
+                listener(loaded)
 
     def __iter__(self) -> Iterator[T]:
         return iter(self._by_id.values())
 
+    def __len__(self) -> int:
+        return len(self._by_id)
+
     def get_by_id(self, id: str) -> Union[None, T]:
         return self._by_id.get(id)
 
 
+def intern_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [sys.intern(x) if isinstance(x, str) else x for x in value]
+    return value
+
+
 class ApiObject(ABC):
+    __slots__ = ('_api', '_data', '_decode')
+
+    # Fields kept from the sync data, None keeps all of them
+    retained_fields: ClassVar[Union[None, FrozenSet[str]]] = None
+    # Fields whose values repeat between objects, like project ids and label names
+    interned_fields: ClassVar[FrozenSet[str]] = frozenset()
 
     def __init__(self, api: 'todoist_api.TodoistAPI', data: Dict[str, Any] = None):
         self._api: 'todoist_api.TodoistAPI' = api
         self._data: Dict[str, Any] = data or {}
+        self._decode: Union[None, Callable[[], Dict[str, Any]]] = None
+
+    @classmethod
+    def lazy(cls, api: 'todoist_api.TodoistAPI', decode: Callable[[], Dict[str, Any]]) -> 'ApiObject':
+        obj = cls.__new__(cls)
+        obj._api = api
+        obj._decode = decode
+        return obj
+
+    def __getattr__(self, item: str) -> Any:
+        # Objects loaded from a snapshot decode their data on first access
+        if item == '_data' and self._decode:
+            self._data = self._project(self._decode())
+            self._decode = None
+            return self._data
+        raise AttributeError(item)
+
+    @classmethod
+    def _project(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        retained = None if RETAIN_ALL_FIELDS else cls.retained_fields
+        interned = cls.interned_fields
+        res = {}
+        for key, value in data.items():
+            if retained is not None and key not in retained:
+                continue
+            res[sys.intern(key)] = intern_value(value) if key in interned else value
+        return res
 
     def _update(self, new_data: Dict[str, Any]):
-        self._data.update(new_data)
+        self._data.update(self._project(new_data))
 
     def _dump_cache(self) -> Dict[str, Any]:
         return self._data
@@ -1,16 +1,83 @@
-from typing import Type, Union
+from typing import Type, Union, Dict, List, Tuple
 
+from todoistapi import todoist_api
 from todoistapi.mixins import ByIdManager, ApiObject
 
 
 # noinspection PyProtectedMember
 class ProjectManager(ByIdManager['Project']):
 
+    def __init__(self, api: 'todoist_api.TodoistAPI'):
+        super().__init__(api)
+        self._children: Dict[Union[None, str], Dict[str, Project]] = {}
+        self._order: Union[None, List[Project]] = None
+        self._depth: Dict[str, int] = {}
+        # Parent and child order of unindexed projects, the order only changes if they are not indexed again unchanged
+        self._unindexed: Dict[str, Tuple[Union[None, str], int]] = {}
+
     def get_managed_type(self) -> Type:
         return Project
 
+    def _index(self, project: 'Project') -> None:
+        self._children.setdefault(project.parent_id, {})[project.id] = project
+        # Renamed or archived projects keep their place, the order holds the objects themselves
+        if self._unindexed.pop(project.id, None) != (project.parent_id, project.child_order):
+            self._order = None
+
+    def _unindex(self, project: 'Project') -> None:
+        siblings = self._children.get(project.parent_id)
+        if siblings:
+            siblings.pop(project.id, None)
+            if not siblings:
+                del self._children[project.parent_id]
+        self._unindexed[project.id] = (project.parent_id, project.child_order)
+
+    def _current_order(self) -> List['Project']:
+        # Projects that were removed or moved are only placed again by rebuilding the whole order, which takes well
+        # below a millisecond for a few hundred projects
+        if self._order is None or self._unindexed:
+            self._unindexed.clear()
+            self._build_order()
+        return self._order
+
+    def _build_order(self) -> None:
+        roots = list(self._children.get(None, {}).values())
+        for parent_id, children in self._children.items():
+            if parent_id is not None and parent_id not in self._by_id:
+                roots.extend(children.values())
+        order = []
+        depth = {}
+        stack = [(project, 0) for project in sorted(roots, key=lambda x: x.child_order, reverse=True)]
+        while stack:
+            project, project_depth = stack.pop()
+            order.append(project)
+            depth[project.id] = project_depth
+            children = self._children.get(project.id, {}).values()
+            stack.extend((child, project_depth + 1)
+                         for child in sorted(children, key=lambda x: x.child_order, reverse=True))
+        self._order = order
+        self._depth = depth
+
+    def sorted(self) -> List['Project']:
+        return self._current_order()
+
+    def depth(self, project: 'Project') -> int:
+        self._current_order()
+        return self._depth.get(project.id, 0)
+
+    def path(self, project: 'Project') -> List['Project']:
+        path = [project]
+        while path[-1].parent_id in self._by_id and len(path) <= len(self._by_id):
+            path.append(self._by_id[path[-1].parent_id])
+        path.reverse()
+        return path
+
 
 class Project(ApiObject):
+    __slots__ = ()
+
+    retained_fields = frozenset({'id', 'name', 'child_order', 'parent_id', 'is_archived', 'is_deleted'})
+    interned_fields = frozenset({'parent_id'})
 
     @property
     def name(self) -> str:
@@ -0,0 +1,300 @@
+import mmap
+import os
+import struct
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+
+# Layout: header, encoded values, string table, shape table, index. All offsets are absolute.
+# Dicts are stored as a shape (their keys and value types) followed by a fixed size struct, so decoding a dict only
+# needs a single unpack. Strings are referenced by their position in the string table.
+MAGIC = b'TDSN'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHxxQQQ')
+COUNT = struct.Struct('<I')
+INDEX_ENTRY = struct.Struct('<IQ')
+INT = struct.Struct('<q')
+FLOAT = struct.Struct('<d')
+OFFSET = struct.Struct('<Q')
+
+TAG_NONE = 0
+TAG_TRUE = 1
+TAG_FALSE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STR = 5
+TAG_LIST = 6
+TAG_DICT = 7
+TAG_STR_LIST = 8
+
+# Types of dict values and their struct format, nested values are stored as offset
+FIELD_NONE = 'n'
+FIELD_BOOL = '?'
+FIELD_INT = 'q'
+FIELD_FLOAT = 'd'
+FIELD_STR = 'I'
+FIELD_VALUE = 'Q'
+
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+
+def field_type(value: Any) -> str:
+    if value is None:
+        return FIELD_NONE
+    if value is True or value is False:
+        return FIELD_BOOL
+    if isinstance(value, int) and INT_MIN <= value <= INT_MAX:
+        return FIELD_INT
+    if isinstance(value, float):
+        return FIELD_FLOAT
+    if isinstance(value, str):
+        return FIELD_STR
+    return FIELD_VALUE
+
+
+class SnapshotWriter:
+
+    def __init__(self) -> None:
+        self._strings: Dict[str, int] = {}
+        self._shapes: Dict[Tuple[Tuple[str, str], ...], int] = {}
+        self._out: bytearray = bytearray(HEADER.size)
+
+    def _ref(self, value: str) -> int:
+        ref = self._strings.get(value)
+        if ref is None:
+            ref = len(self._strings)
+            self._strings[value] = ref
+        return ref
+
+    def _shape(self, shape: Tuple[Tuple[str, str], ...]) -> int:
+        ref = self._shapes.get(shape)
+        if ref is None:
+            ref = len(self._shapes)
+            self._shapes[shape] = ref
+            for key, _ in shape:
+                self._ref(key)
+        return ref
+
+    def _encode(self, value: Any) -> bytes:
+        kind = field_type(value)
+        if kind == FIELD_NONE:
+            return bytes([TAG_NONE])
+        if kind == FIELD_BOOL:
+            return bytes([TAG_TRUE if value else TAG_FALSE])
+        if kind == FIELD_INT:
+            return bytes([TAG_INT]) + INT.pack(value)
+        if kind == FIELD_FLOAT:
+            return bytes([TAG_FLOAT]) + FLOAT.pack(value)
+        if kind == FIELD_STR:
+            return bytes([TAG_STR]) + COUNT.pack(self._ref(value))
+        if isinstance(value, (list, tuple)) and value and all(isinstance(x, str) for x in value):
+            # Mostly labels, decoded with a single unpack
+            return bytes([TAG_STR_LIST]) + COUNT.pack(len(value)) + struct.pack(
+                '<{}I'.format(len(value)), *[self._ref(x) for x in value])
+        if isinstance(value, (list, tuple)):
+            return bytes([TAG_LIST]) + COUNT.pack(len(value)) + b''.join(self._encode(x) for x in value)
+        if isinstance(value, dict):
+            shape = tuple((str(key), field_type(x)) for key, x in value.items())
+            fields = []
+            for (_, kind), x in zip(shape, value.values()):
+                if kind == FIELD_STR:
+                    fields.append(self._ref(x))
+                elif kind == FIELD_VALUE:
+                    fields.append(self.add(x))
+                elif kind != FIELD_NONE:
+                    fields.append(x)
+            fmt = '<' + ''.join(kind for _, kind in shape if kind != FIELD_NONE)
+            return bytes([TAG_DICT]) + COUNT.pack(self._shape(shape)) + struct.pack(fmt, *fields)
+        if isinstance(value, int):
+            raise ValueError('Integer {} is too large for a snapshot'.format(value))
+        raise TypeError('Can not store {} in snapshot'.format(type(value)))
+
+    def add(self, value: Any) -> int:
+        encoded = self._encode(value)
+        offset = len(self._out)
+        self._out += encoded
+        return offset
+
+    def write(self, path: str, sync_token: Union[None, str], user: Dict[str, Any], day_orders: Dict[str, Any],
+              objects: Dict[str, List[Dict[str, Any]]]) -> None:
+        state_offset = self.add({'sync_token': sync_token, 'user': user, 'day_orders': day_orders})
+        index = bytearray(OFFSET.pack(state_offset))
+        index += COUNT.pack(len(objects))
+        for kind, data in objects.items():
+            index += COUNT.pack(self._ref(kind))
+            index += COUNT.pack(len(data))
+            for obj in data:
+                index += INDEX_ENTRY.pack(self._ref(obj['id']), self.add(obj))
+
+        shapes = bytearray(COUNT.pack(len(self._shapes)))
+        for shape in self._shapes:
+            shapes += COUNT.pack(len(shape))
+            for key, kind in shape:
+                shapes += COUNT.pack(self._ref(key))
+                shapes += kind.encode('ascii')
+
+        encoded = [value.encode('utf-8') for value in self._strings]
+        strings = bytearray(COUNT.pack(len(encoded)))
+        end = 0
+        for value in encoded:
+            end += len(value)
+            strings += COUNT.pack(end)
+        strings_offset = len(self._out)
+        shapes_offset = strings_offset + len(strings) + end
+        index_offset = shapes_offset + len(shapes)
+        HEADER.pack_into(self._out, 0, MAGIC, VERSION, strings_offset, shapes_offset, index_offset)
+
+        # Readers might still map the old file, so it is replaced instead of overwritten
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._out)
+            f.write(strings)
+            for value in encoded:
+                f.write(value)
+            f.write(shapes)
+            f.write(index)
+        os.replace(tmp_path, path)
+
+
+class LazyRecords:
+
+    def __init__(self, snapshot: 'Snapshot', entries: List[Tuple[int, int]]) -> None:
+        self._snapshot: Snapshot = snapshot
+        self._entries: List[Tuple[int, int]] = entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Tuple[str, Callable[[], Dict[str, Any]]]]:
+        snapshot = self._snapshot
+        for id_ref, offset in self._entries:
+            yield snapshot.string(id_ref), lambda o=offset: snapshot.decode_at(o)
+
+
+class Shape:
+
+    def __init__(self, keys: List[str], kinds: List[str]) -> None:
+        self.keys: Tuple[str, ...] = tuple(key for key, kind in zip(keys, kinds) if kind != FIELD_NONE)
+        self.none_keys: Tuple[str, ...] = tuple(key for key, kind in zip(keys, kinds) if kind == FIELD_NONE)
+        self.struct: struct.Struct = struct.Struct('<' + ''.join(kind for kind in kinds if kind != FIELD_NONE))
+        stored = [kind for kind in kinds if kind != FIELD_NONE]
+        self.strings: Tuple[int, ...] = tuple(i for i, kind in enumerate(stored) if kind == FIELD_STR)
+        self.values: Tuple[int, ...] = tuple(i for i, kind in enumerate(stored) if kind == FIELD_VALUE)
+
+
+class Snapshot:
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            self._buffer: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        # Objects that were not decoded yet can not be decoded afterwards
+        self._buffer.close()
+
+    def _read_index(self) -> None:
+        magic, version, strings_offset, shapes_offset, index_offset = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a snapshot')
+        if version != VERSION:
+            raise ValueError('Unsupported snapshot version {}'.format(version))
+
+        count, = COUNT.unpack_from(self._buffer, strings_offset)
+        ends_offset = strings_offset + COUNT.size
+        self._string_ends: Tuple[int, ...] = struct.unpack_from('<{}I'.format(count), self._buffer, ends_offset)
+        self._string_start: int = ends_offset + count * COUNT.size
+        self._strings: List[Union[None, str]] = [None] * count
+
+        count, = COUNT.unpack_from(self._buffer, shapes_offset)
+        offset = shapes_offset + COUNT.size
+        self._shapes: List[Shape] = []
+        for _ in range(count):
+            size, = COUNT.unpack_from(self._buffer, offset)
+            offset += COUNT.size
+            keys = []
+            kinds = []
+            for _ in range(size):
+                keys.append(self.string(COUNT.unpack_from(self._buffer, offset)[0]))
+                kinds.append(chr(self._buffer[offset + COUNT.size]))
+                offset += COUNT.size + 1
+            self._shapes.append(Shape(keys, kinds))
+
+        state_offset, = OFFSET.unpack_from(self._buffer, index_offset)
+        kinds, = COUNT.unpack_from(self._buffer, index_offset + OFFSET.size)
+        offset = index_offset + OFFSET.size + COUNT.size
+        self._records: Dict[str, LazyRecords] = {}
+        for _ in range(kinds):
+            kind_ref, count = struct.unpack_from('<II', self._buffer, offset)
+            offset += 2 * COUNT.size
+            end = offset + count * INDEX_ENTRY.size
+            entries = list(INDEX_ENTRY.iter_unpack(self._buffer[offset:end]))
+            self._records[self.string(kind_ref)] = LazyRecords(self, entries)
+            offset = end
+        self.state: Dict[str, Any] = self.decode_at(state_offset)
+
+    def string(self, ref: int) -> str:
+        # Decoded strings are shared, so repeated labels and ids are only kept once
+        value = self._strings[ref]
+        if value is None:
+            start = self._string_start + (self._string_ends[ref - 1] if ref else 0)
+            value = self._buffer[start:self._string_start + self._string_ends[ref]].decode('utf-8')
+            self._strings[ref] = value
+        return value
+
+    def records(self, kind: str) -> LazyRecords:
+        return self._records.get(kind) or LazyRecords(self, [])
+
+    def decode_at(self, offset: int) -> Any:
+        return self._decode(offset)[0]
+
+    def _decode_dict(self, offset: int) -> Tuple[Dict[str, Any], int]:
+        shape = self._shapes[COUNT.unpack_from(self._buffer, offset)[0]]
+        offset += COUNT.size
+        values = list(shape.struct.unpack_from(self._buffer, offset))
+        strings = self._strings
+        for i in shape.strings:
+            value = strings[values[i]]
+            values[i] = value if value is not None else self.string(values[i])
+        for i in shape.values:
+            values[i] = self._decode(values[i])[0]
+        res = dict(zip(shape.keys, values))
+        for key in shape.none_keys:
+            res[key] = None
+        return res, offset + shape.struct.size
+
+    def _decode(self, offset: int) -> Tuple[Any, int]:
+        tag = self._buffer[offset]
+        offset += 1
+        if tag == TAG_DICT:
+            return self._decode_dict(offset)
+        if tag == TAG_STR:
+            return self.string(COUNT.unpack_from(self._buffer, offset)[0]), offset + COUNT.size
+        if tag == TAG_STR_LIST:
+            count, = COUNT.unpack_from(self._buffer, offset)
+            offset += COUNT.size
+            refs = struct.unpack_from('<{}I'.format(count), self._buffer, offset)
+            return [self.string(ref) for ref in refs], offset + count * COUNT.size
+        if tag == TAG_LIST:
+            count, = COUNT.unpack_from(self._buffer, offset)
+            offset += COUNT.size
+            res = []
+            for _ in range(count):
+                value, offset = self._decode(offset)
+                res.append(value)
+            return res, offset
+        if tag == TAG_NONE:
+            return None, offset
+        if tag == TAG_TRUE:
+            return True, offset
+        if tag == TAG_FALSE:
+            return False, offset
+        if tag == TAG_INT:
+            return INT.unpack_from(self._buffer, offset)[0], offset + INT.size
+        if tag == TAG_FLOAT:
+            return FLOAT.unpack_from(self._buffer, offset)[0], offset + FLOAT.size
+        raise ValueError('Invalid tag {} in snapshot'.format(tag))
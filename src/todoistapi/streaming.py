@@ -0,0 +1,157 @@
+import codecs
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRUCTURE = re.compile(r'[\[\]{}"]')
+STRING_END = re.compile(r'["\\]')
+SCALAR_END = re.compile(r'[,:\]} \t\n\r]')
+
+
+class StreamParser:
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder('utf-8')()
+        # The decoder only shares equal keys within a single value, so keys are shared over all values here
+        self._keys: Dict[str, str] = {}
+        self._json: json.JSONDecoder = json.JSONDecoder(object_pairs_hook=self._object)
+        self._buffer: str = ''
+        self._pos: int = 0
+
+    def _object(self, pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        keys = self._keys
+        return {keys.setdefault(key, key): value for key, value in pairs}
+
+    def _read(self) -> Union[None, str]:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            text = self._decoder.decode(b'', final=True)
+            return text or None
+        return self._decoder.decode(chunk)
+
+    def _fill(self, pieces: List[str] = None) -> bool:
+        if pieces is None:
+            text = self._read()
+            if text is None:
+                return False
+            pieces = [text]
+        # Parsed input is dropped, so only the current value is kept in memory
+        self._buffer = self._buffer[self._pos:] + ''.join(pieces)
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of sync response')
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError('Expected {} at {!r}'.format(char, self._buffer[self._pos:self._pos + 20]))
+        self._pos += 1
+
+    def _scan(self) -> None:
+        # Reads input until the string, list or object at the current position is complete, so it is decoded once.
+        # New input is scanned piece by piece and only added to the buffer at the end.
+        text = self._buffer
+        offset = self._pos
+        pieces = []
+        depth = 0
+        in_string = False
+        escaped = False
+        while True:
+            match = (STRING_END if in_string else STRUCTURE).search(text, offset)
+            while match is not None:
+                char = match.group()
+                offset = match.end()
+                if char == '\\':
+                    if offset < len(text):
+                        offset += 1
+                    else:
+                        # The escaped character is in the next piece
+                        escaped = True
+                elif char == '"':
+                    in_string = not in_string
+                    if not in_string and not depth:
+                        self._fill(pieces)
+                        return
+                elif char in '[{':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if not depth:
+                        self._fill(pieces)
+                        return
+                match = (STRING_END if in_string else STRUCTURE).search(text, offset)
+            text = self._read()
+            if text is None:
+                raise ValueError('Unexpected end of sync response')
+            pieces.append(text)
+            offset = 0
+            if escaped and text:
+                offset = 1
+                escaped = False
+
+    def _scan_scalar(self) -> None:
+        # Numbers and literals are complete once a delimiter follows them
+        if SCALAR_END.search(self._buffer, self._pos):
+            return
+        pieces = []
+        while True:
+            text = self._read()
+            if text is None:
+                break
+            pieces.append(text)
+            if SCALAR_END.search(text):
+                break
+        self._fill(pieces)
+
+    def _value(self) -> Any:
+        if self._peek() in '[{"':
+            self._scan()
+        else:
+            self._scan_scalar()
+        value, self._pos = self._json.raw_decode(self._buffer, self._pos)
+        return value
+
+    def parse(self, sinks: Dict[str, Callable[[List[Any]], None]], batch_size: int) -> Dict[str, Any]:
+        rest = {}
+        self._expect('{')
+        if self._peek() == '}':
+            return rest
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key in sinks and self._peek() == '[':
+                self._expect('[')
+                batch = []
+                if self._peek() != ']':
+                    while True:
+                        batch.append(self._value())
+                        if len(batch) >= batch_size:
+                            sinks[key](batch)
+                            batch = []
+                        if self._peek() != ',':
+                            break
+                        self._pos += 1
+                self._expect(']')
+                if batch:
+                    sinks[key](batch)
+            else:
+                rest[key] = self._value()
+            if self._peek() != ',':
+                break
+            self._pos += 1
+        self._expect('}')
+        return rest
+
+
+def parse_sync(chunks: Iterable[bytes], sinks: Dict[str, Callable[[List[Any]], None]],
+               batch_size: int) -> Dict[str, Any]:
+    # Elements of the lists in sinks are passed on in batches, everything else is returned
+    return StreamParser(chunks).parse(sinks, batch_size)
@@ -0,0 +1,65 @@
+import datetime
+from typing import Dict, List, Tuple, Union
+
+from todoistapi import items as items_mod
+from todoistapi.columns import ItemColumns
+
+
+class TodayView:
+
+    def __init__(self, items: 'items_mod.ItemManager', today: datetime.date) -> None:
+        self._items: items_mod.ItemManager = items
+        self._columns: Union[None, ItemColumns] = items.get_columns()
+        self.today: datetime.date = today
+        self.due_today: List[items_mod.Item] = []
+        self.overdue: List[items_mod.Item] = []
+        self._by_label: Dict[str, List[items_mod.Item]] = {}
+        # Items due today or later at a specific time, ordered by their due time in UTC
+        self._upcoming_timed: Union[None, List[Tuple[datetime.datetime, items_mod.Item]]] = None
+        if self._columns is not None:
+            # Large accounts are queried on the item columns, labels are only selected once asked for
+            self.due_today = items.select(checked=False, deleted=False, due_on=today)
+            self.overdue = items.select(checked=False, deleted=False, due_before=today)
+            return
+        self._upcoming_timed = []
+        for item in items:
+            if item.checked or item.is_deleted:
+                continue
+            for label in item.labels:
+                self._by_label.setdefault(label, []).append(item)
+            due = item.due
+            due_date = due.date
+            if not due_date:
+                continue
+            day = due.parsed_day.date()
+            if day == today:
+                self.due_today.append(item)
+            elif day < today:
+                self.overdue.append(item)
+            if day >= today and 'T' in due_date:
+                self._upcoming_timed.append((due.parsed_datetime_utc, item))
+        self._upcoming_timed.sort(key=lambda entry: entry[0])
+
+    @property
+    def upcoming_timed(self) -> List[Tuple[datetime.datetime, 'items_mod.Item']]:
+        if self._upcoming_timed is None:
+            upcoming = []
+            for item in self._items.select(checked=False, deleted=False):
+                due_date = item.due.date
+                if due_date and 'T' in due_date and item.due.parsed_day.date() >= self.today:
+                    upcoming.append((item.due.parsed_datetime_utc, item))
+            upcoming.sort(key=lambda entry: entry[0])
+            self._upcoming_timed = upcoming
+        return self._upcoming_timed
+
+    def labelled(self, label: str) -> List['items_mod.Item']:
+        res = self._by_label.get(label)
+        if res is None:
+            if self._columns is None:
+                return []
+            res = self._items.select(checked=False, deleted=False, label=label)
+            self._by_label[label] = res
+        return res
+
+    def overdue_labelled(self, label: str) -> List['items_mod.Item']:
+        return [item for item in self.overdue if label in item.labels]
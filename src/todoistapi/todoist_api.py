@@ -8,24 +8,32 @@ from typing import Dict, List, Any, Union
 
 import requests
 
+from storage import storage as storage_mod
+from todoistapi import commit_planner, streaming
 from todoistapi.items import ItemManager
 from todoistapi.labels import LabelManager
 from todoistapi.projects import ProjectManager
+from todoistapi.today import TodayView
 from todoistapi.user import User
-from utils.consts import CACHE_PATH
 
 logger = logging.getLogger(__name__)
 
 RESOURCE_TYPES = '["user", "projects", "labels", "items", "day_orders"]'
+SYNC_URL = os.environ.get('TODOIST_SYNC_URL', 'https://api.todoist.com/api/v1/sync')
+STREAM_FULL_SYNC = os.environ.get('TODOISTANT_STREAM_SYNC', '1') == '1'
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_BATCH_SIZE = 500
 
 
 # noinspection PyProtectedMember
 class TodoistAPI:
 
-    def __init__(self, token: str, cache_dir: str) -> None:
+    def __init__(self, token: str, storage: 'storage_mod.Storage', user_id: str = None) -> None:
         self._successful_sync: bool = False
         self._token: str = token
-        self._cache_dir: str = cache_dir
+        self._storage: Union['storage_mod.Storage', None] = storage
+        # The cache is keyed by the Todoist user id, the token is only used as credential
+        self._cache_key: Union[str, None] = user_id
         self._sync_token: str = '*'
         self._command_queue: List[Dict[str, Any]] = []
         self._session: requests.Session = requests.Session()
@@ -35,10 +43,12 @@ class TodoistAPI:
         self.items = ItemManager(self)
         self.projects = ProjectManager(self)
         self.labels = LabelManager(self)
+        self._today_view: Union[TodayView, None] = None
+        self._today_view_key: Union[tuple, None] = None
 
         self._load_cache()
 
-    def _sync(self, commands: List[Dict[str, Any]] = None, resource_types: str = None) -> None:
+    def _sync(self, commands: List[Dict[str, Any]] = None, resource_types: str = None) -> Union[None, Dict[str, Any]]:
         data = {
             'sync_token': self._sync_token,
             'resource_types': resource_types or RESOURCE_TYPES,
@@ -46,19 +56,29 @@ class TodoistAPI:
         if commands:
             data['commands'] = json.dumps(commands)
             logger.debug('Execute Todoist commands: %s', commands)
+        # Full syncs of large accounts are parsed while they are received, so the whole response is never in memory
+        stream = STREAM_FULL_SYNC and not commands and self._sync_token == '*'
         result = self._session.post(
-            'https://api.todoist.com/api/v1/sync',
+            SYNC_URL,
             data=data,
             headers={
                 'Authorization': f'Bearer {self._token}',
                 'Content-Type': 'application/x-www-form-urlencoded',
-            }
+            },
+            stream=stream,
         )
         if result.status_code != 200:
             logger.error('Failed to sync with Todoist: %s', result.text)
-            return
-
-        parsed = result.json()
+            return None
+
+        if stream:
+            parsed = streaming.parse_sync(result.iter_content(STREAM_CHUNK_SIZE), {
+                'items': self.items._update,
+                'projects': self.projects._update,
+                'labels': self.labels._update,
+            }, STREAM_BATCH_SIZE)
+        else:
+            parsed = result.json()
         self._sync_token = parsed['sync_token']
         for status_key in parsed.get('sync_status', []):
             if parsed['sync_status'][status_key] != 'ok':
@@ -75,8 +95,10 @@ class TodoistAPI:
             item = self.items.get_by_id(id)
             if item:
                 item._data['day_order'] = order
+                self.items._mark_changed(id)
         self._save_cache()
         self._successful_sync = True
+        return parsed
 
     def _enqueue_command(self, command_type: str, args: Dict[str, Any]) -> Union[str, None]:
         command_id = str(uuid.uuid4())
@@ -93,47 +115,93 @@ class TodoistAPI:
         return item_id
 
     def _load_cache(self) -> None:
-        if not self._cache_dir:
+        if not self._storage:
             return
         logger.info('Load API cache...')
-        cache_file = os.path.join(self._cache_dir, f'{self._token}.json')
-        cache_sync_file = os.path.join(self._cache_dir, f'{self._token}.sync')
-        if os.path.isfile(cache_file):
-            with open(cache_file) as f:
-                cache = json.load(f)
-                self.user._load_cache(cache.get('user'))
-                self._day_orders.update(cache.get('day_orders'))
-                self.items._load_cache(cache.get('items'))
-                self.projects._load_cache(cache.get('projects'))
-                self.labels._load_cache(cache.get('labels'))
-            # If there is a sync file but no cache file we want to perform a full sync
-            if os.path.isfile(cache_sync_file):
-                with open(cache_sync_file) as f:
-                    self._sync_token = f.readline().strip()
+        cache = self._storage.load_api_cache(self._cache_key) if self._cache_key else None
+        legacy_key = None
+        if not cache and self._token:
+            # Caches used to be keyed by token
+            cache = self._storage.load_api_cache(self._token)
+            legacy_key = self._token
+        if cache:
+            self.user._load_cache(cache.get('user'))
+            self._day_orders.update(cache.get('day_orders'))
+            self.items._load_cache(cache.get('items'))
+            self.projects._load_cache(cache.get('projects'))
+            self.labels._load_cache(cache.get('labels'))
+            for manager in [self.items, self.projects, self.labels]:
+                manager._take_changes()
+            if cache.get('sync_token'):
+                self._sync_token = cache['sync_token']
             logger.info('API cache for user %s loaded', self.user.id)
+            if legacy_key and self.user.id:
+                logger.info('Move API cache of user %s from token to user id', self.user.id)
+                self._cache_key = self.user.id
+                for manager in [self.items, self.projects, self.labels]:
+                    for obj in manager:
+                        manager._mark_changed(obj.id)
+                self._save_cache()
+                self._storage.delete_api_cache(legacy_key)
         else:
             logger.info('No API cache available')
 
+    def close(self) -> None:
+        # Objects still loaded lazily from the cache can not be used anymore
+        if self._storage and self._cache_key:
+            self._storage.release_api_cache(self._cache_key)
+
     def _save_cache(self) -> None:
-        if not self._cache_dir:
+        if not self._storage:
+            return
+        if not self._cache_key:
+            self._cache_key = self.user.id
+        if not self._cache_key:
+            return
+        if self.user.id and self.user.id != self._cache_key:
+            logger.error('Token of user %s used for cache of user %s', self.user.id, self._cache_key)
             return
         logger.debug('Save API cache for user %s', self.user.id)
-        to_save = {
-            'user': self.user._dump_cache(),
-            'day_orders': self._day_orders,
-            'items': self.items._dump_cache(),
-            'projects': self.projects._dump_cache(),
-            'labels': self.labels._dump_cache(),
-        }
-        with open(os.path.join(self._cache_dir, f'{self._token}.json'), 'w') as f:
-            json.dump(to_save, f)
-        with open(os.path.join(self._cache_dir, f'{self._token}.sync'), 'w') as f:
-            print(self._sync_token, file=f)
-
-    def commit(self) -> None:
-        for start in range(0, len(self._command_queue), 99):
-            self._sync(self._command_queue[start:start + 99])
+        self._storage.save_api_cache(self._cache_key, self)
+
+    def commit(self) -> commit_planner.CommitResult:
+        plan = commit_planner.CommitPlan(list(self._command_queue))
+        result = commit_planner.CommitResult()
+        temp_id_mapping = {}
+        failed_temp_ids = set()
+        for chunk in plan.chunks:
+            commands = []
+            for i in chunk:
+                command = plan.commands[i]
+                if plan.depends[i] & failed_temp_ids:
+                    # Depends on an object that was not created
+                    result.set_status(command, commit_planner.STATUS_SKIPPED)
+                    if 'temp_id' in command:
+                        failed_temp_ids.add(command['temp_id'])
+                    continue
+                if plan.depends[i]:
+                    # Temporary ids are only resolved within a request, later requests need the real ids
+                    command = dict(command, args=commit_planner.replace_ids(command['args'], temp_id_mapping))
+                commands.append(command)
+            if not commands:
+                continue
+            parsed = self._sync(commands)
+            result.round_trips += 1
+            sync_status = parsed.get('sync_status', {}) if parsed is not None else {}
+            for command in commands:
+                status = sync_status.get(command['uuid'], commit_planner.STATUS_OK) if parsed is not None \
+                    else commit_planner.STATUS_FAILED
+                result.set_status(command, status)
+                if status != commit_planner.STATUS_OK and 'temp_id' in command:
+                    failed_temp_ids.add(command['temp_id'])
+            if parsed is not None:
+                temp_id_mapping.update(parsed.get('temp_id_mapping') or {})
         self._command_queue.clear()
+        # Objects that were never created are only known locally
+        for temp_id in failed_temp_ids:
+            for manager in [self.items, self.projects, self.labels]:
+                manager._remove(temp_id)
+        return result
 
     def abort(self) -> None:
         self._command_queue.clear()
@@ -141,6 +209,9 @@ class TodoistAPI:
     def sync(self) -> None:
         self._sync()
 
+    def set_token(self, token: str) -> None:
+        self._token = token
+
     def sync_user_info(self) -> None:
         self._sync(resource_types='["user"]')
 
@@ -148,12 +219,27 @@ class TodoistAPI:
     def timezone(self) -> datetime.timezone:
         return self.user.timezone
 
+    def today_view(self) -> TodayView:
+        # Shared by all assistants of a user, computed again once items change or the day changes
+        today = datetime.datetime.now(self.timezone).date()
+        key = (self.items.version, today, self.timezone)
+        if self._today_view is None or self._today_view_key != key:
+            self._today_view = TodayView(self.items, today)
+            self._today_view_key = key
+        return self._today_view
+
     def had_successful_sync(self) -> bool:
         return self._successful_sync
 
+    def has_pending_commands(self) -> bool:
+        return bool(self._command_queue)
+
+    def object_count(self) -> int:
+        return len(self.items) + len(self.projects) + len(self.labels)
+
 
-def get_api(token, sync=True, cache=True) -> TodoistAPI:
-    api = TodoistAPI(token, f'./{CACHE_PATH}/' if cache else None)
+def get_api(token, sync=True, cache=True, user_id=None) -> TodoistAPI:
+    api = TodoistAPI(token, storage_mod.get_storage() if cache else None, user_id)
     if sync:
         api.sync()
     return api
@@ -0,0 +1,36 @@
+import lzma
+import os
+import zlib
+from typing import Dict, Tuple
+
+METHODS = ('none', 'zlib', 'lzma')
+DEFAULT_LEVELS: Dict[str, int] = {'zlib': 6, 'lzma': 1}
+
+LZMA_MAGIC = b'\xfd7zXZ\x00'
+# Second byte of a zlib stream for each compression level class
+ZLIB_FLAGS = (0x01, 0x5e, 0x9c, 0xda)
+
+
+def get_default() -> Tuple[str, int]:
+    method = os.environ.get('TODOISTANT_COMPRESSION', 'none')
+    if method not in METHODS:
+        raise ValueError('Unknown compression {}'.format(method))
+    level = os.environ.get('TODOISTANT_COMPRESSION_LEVEL')
+    return method, int(level) if level else DEFAULT_LEVELS.get(method, 0)
+
+
+def compress(data: bytes, method: str, level: int) -> bytes:
+    if method == 'zlib':
+        return zlib.compress(data, level)
+    if method == 'lzma':
+        return lzma.compress(data, preset=level)
+    return data
+
+
+def decompress(data: bytes) -> bytes:
+    # Uncompressed files are JSON and can not start with either magic
+    if data[:len(LZMA_MAGIC)] == LZMA_MAGIC:
+        return lzma.decompress(data)
+    if len(data) > 1 and data[0] == 0x78 and data[1] in ZLIB_FLAGS:
+        return zlib.decompress(data)
+    return data
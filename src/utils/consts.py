@@ -1,3 +1,5 @@
 SOCKET_NAME = 'todoistant.sock'
 CACHE_PATH = 'cache'
 CONFIG_PATH = 'config'
+ARCHIVE_PATH = 'archive'
+DATABASE_PATH = 'todoistant.db'
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Deque, Iterator, Any
+
+SAMPLE_SIZE: int = 1000
+
+
+class LatencyStats:
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+        self.samples: Deque[float] = deque(maxlen=SAMPLE_SIZE)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def to_dict(self) -> Dict[str, float]:
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': self.max,
+        }
+
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._latencies: Dict[str, LatencyStats] = {}
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(name, LatencyStats()).observe(seconds)
+
+    @contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'latencies': {name: stats.to_dict() for name, stats in self._latencies.items()},
+            }
@@ -1,50 +1,185 @@
 import dataclasses
 import importlib
 import json
+import os
 from datetime import datetime
-from typing import Any, Union
+from typing import Any, Union, Callable, Dict, Tuple, Type, List
+
+_classes: Dict[Tuple[str, str], Type] = {}
+_dataclass_fields: Dict[Type, Tuple[str, ...]] = {}
+_encoders: Dict[Type, Callable[[Any], Any]] = {}
+_decoders: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+
+
+def register_encoder(klass: Type, encoder: Callable[[Any], Any]) -> None:
+    _encoders[klass] = encoder
+
+
+def register_decoder(tag: str, decoder: Callable[[Dict[str, Any]], Any]) -> None:
+    _decoders[tag] = decoder
+
+
+def resolve_class(module: str, qualname: str) -> Type:
+    key = (module, qualname)
+    if key not in _classes:
+        _classes[key] = getattr(importlib.import_module(module), qualname)
+    return _classes[key]
+
+
+def dataclass_to_dict(o: Any) -> Any:
+    # Same result as dataclasses.asdict for the values we store, without deep copying every leaf
+    if isinstance(o, (str, int, float, type(None))):
+        return o
+    if type(o) in _dataclass_fields or dataclasses.is_dataclass(o) and not isinstance(o, type):
+        fields = _dataclass_fields.get(type(o))
+        if fields is None:
+            fields = tuple(field.name for field in dataclasses.fields(o))
+            _dataclass_fields[type(o)] = fields
+        return {name: dataclass_to_dict(getattr(o, name)) for name in fields}
+    if isinstance(o, (list, tuple)):
+        return type(o)(dataclass_to_dict(x) for x in o)
+    if isinstance(o, dict):
+        return type(o)((dataclass_to_dict(k), dataclass_to_dict(v)) for k, v in o.items())
+    return o
+
+
+def encode_datetime(o: datetime) -> Dict[str, Any]:
+    return {
+        '__datetime__': True,
+        'value': o.isoformat()
+    }
+
+
+def encode_dataclass(o: Any) -> Dict[str, Any]:
+    return {
+        '__dataclass__': [type(o).__module__, type(o).__qualname__],
+        'value': dataclass_to_dict(o)
+    }
+
+
+def decode_datetime(o: Dict[str, Any]) -> datetime:
+    return datetime.fromisoformat(o['value'])
+
+
+def decode_dataclass(o: Dict[str, Any]) -> Any:
+    return resolve_class(*o['__dataclass__'])(**o['value'])
+
+
+register_encoder(datetime, encode_datetime)
+register_decoder('__datetime__', decode_datetime)
+register_decoder('__dataclass__', decode_dataclass)
 
 
 def json_object_hook(o: Any) -> Any:
-    if '__datetime__' in o:
-        return datetime.fromisoformat(o['value'])
-    if '__dataclass__' in o:
-        module = importlib.import_module(o['__dataclass__'][0])
-        klass = getattr(module, o['__dataclass__'][1])
-        return klass(**o['value'])
+    for tag in _decoders:
+        if tag in o:
+            return _decoders[tag](o)
     return o
 
 
 def json_default(o: Any) -> Any:
-    from config.config import ChangeDict, ChangeList
-    if isinstance(o, ChangeDict):
-        return o.to_dict()
-    if isinstance(o, ChangeList):
-        return o.to_dict()
-    if isinstance(o, datetime):
-        return {
-            '__datetime__': True,
-            'value': o.isoformat()
-        }
-    if dataclasses.is_dataclass(o):
-        return {
-            '__dataclass__': [type(o).__module__, type(o).__qualname__],
-            'value': dataclasses.asdict(o)
-        }
-    raise TypeError
+    encoder = _encoders.get(type(o))
+    if encoder is None:
+        if dataclasses.is_dataclass(o):
+            encoder = encode_dataclass
+        else:
+            for klass in list(_encoders):
+                if isinstance(o, klass):
+                    encoder = _encoders[klass]
+                    break
+            else:
+                raise TypeError
+        _encoders[type(o)] = encoder
+    return encoder(o)
+
+
+class StdlibBackend:
+    name: str = 'stdlib'
+    item_separator: str = ', '
+    key_separator: str = ': '
+
+    def load(self, f: Any) -> Any:
+        return json.load(f, object_hook=json_object_hook)
+
+    def loads(self, s: Union[str, bytes]) -> Any:
+        return json.loads(s, object_hook=json_object_hook)
+
+    def dump(self, obj: Any, f: Any) -> None:
+        json.dump(obj, f, default=json_default)
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, default=json_default)
+
+
+class OrjsonBackend:
+    name: str = 'orjson'
+    item_separator: str = ','
+    key_separator: str = ':'
+
+    def __init__(self) -> None:
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def load(self, f: Any) -> Any:
+        return self.loads(f.read())
+
+    def loads(self, s: Union[str, bytes]) -> Any:
+        if isinstance(s, str):
+            s = s.encode()
+        # Tagged values need the object hook, which the stdlib parser applies faster than walking the parsed tree
+        if b'"__' in s:
+            return json.loads(s, object_hook=json_object_hook)
+        return self._orjson.loads(s)
+
+    def dump(self, obj: Any, f: Any) -> None:
+        f.write(self.dumps(obj))
+
+    def dumps(self, obj: Any) -> str:
+        return self._orjson.dumps(obj, default=json_default, option=self._options).decode()
+
+
+BACKENDS: Dict[str, Callable[[], Union[StdlibBackend, OrjsonBackend]]] = {
+    'stdlib': StdlibBackend,
+    'orjson': OrjsonBackend,
+}
+
+
+def get_available_backends() -> List[str]:
+    res = []
+    for name, backend in BACKENDS.items():
+        try:
+            backend()
+            res.append(name)
+        except ImportError:
+            pass
+    return res
+
+
+def create_backend(name: str = None) -> Union[StdlibBackend, OrjsonBackend]:
+    name = name or os.environ.get('TODOISTANT_JSON_BACKEND')
+    if name:
+        return BACKENDS[name]()
+    try:
+        return OrjsonBackend()
+    except ImportError:
+        return StdlibBackend()
+
+
+backend = create_backend()
 
 
 def load(f: Any) -> Any:
-    return json.load(f, object_hook=json_object_hook)
+    return backend.load(f)
 
 
 def loads(s: Union[str, bytes]) -> Any:
-    return json.loads(s, object_hook=json_object_hook)
+    return backend.loads(s)
 
 
 def dump(obj: Any, f: Any) -> None:
-    json.dump(obj, f, default=json_default)
+    backend.dump(obj, f)
 
 
 def dumps(obj: Any) -> str:
-    return json.dumps(obj, default=json_default)
+    return backend.dumps(obj)
@@ -4,7 +4,6 @@ from datetime import timezone, datetime, timedelta
 from typing import Callable, Set, Dict, List
 
 from todoistapi.hooks import HookData
-from todoistapi.projects import Project
 
 logger = logging.getLogger(__name__)
 
@@ -37,15 +36,33 @@ def local_to_utc(date: datetime) -> datetime:
     return date
 
 
-def sort_projects(projects: List[Project]) -> List[Project]:
-    id_to_project = {project.id: project for project in projects}
-
-    def get_sort_key(project: Project) -> List[int]:
-        if project.parent_id:
-            return get_sort_key(id_to_project[project.parent_id]) + [project.child_order]
-        return [project.child_order]
-
-    return sorted(projects, key=get_sort_key)
+def split_text(text: str, limit: int) -> List[str]:
+    # Telegram measures message length in UTF-16 code units
+    def length(part: str) -> int:
+        return len(part.encode('utf-16-le')) // 2
+
+    parts = []
+    current = None
+    for line in text.split('\n'):
+        while length(line) > limit:
+            cut = limit
+            while length(line[:cut]) > limit:
+                cut -= 1
+            if current is not None:
+                parts.append(current)
+                current = None
+            parts.append(line[:cut])
+            line = line[cut:]
+        if current is None:
+            current = line
+        elif length(current) + 1 + length(line) <= limit:
+            current += '\n' + line
+        else:
+            parts.append(current)
+            current = line
+    if current is not None:
+        parts.append(current)
+    return parts
 
 
 def parse_task_config(content: str) -> (str, Dict[str, str]):
@@ -0,0 +1,76 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Deque, Hashable, Set, List
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool:
+
+    def __init__(self, name: str, workers: int, max_queued: int = 0) -> None:
+        self._name: str = name
+        self._max_queued: int = max_queued
+        self._condition: threading.Condition = threading.Condition()
+        self._queues: Dict[Hashable, Deque[Callable[[], None]]] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._active: Set[Hashable] = set()
+        self._queued: int = 0
+        self._should_shutdown: bool = False
+        self._threads: List[threading.Thread] = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f'{name}-{i}')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key: Hashable, task: Callable[[], None]) -> bool:
+        with self._condition:
+            if self._should_shutdown or (self._max_queued and self._queued >= self._max_queued):
+                return False
+            queue = self._queues.setdefault(key, deque())
+            queue.append(task)
+            self._queued += 1
+            # A key is ready iff it has queued tasks and no worker is currently processing it
+            if key not in self._active and len(queue) == 1:
+                self._ready.append(key)
+                self._condition.notify()
+            return True
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready and not self._should_shutdown:
+                    self._condition.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                self._active.add(key)
+                task = self._queues[key].popleft()
+                self._queued -= 1
+            try:
+                task()
+            except Exception as e:
+                logger.error('Error in %s worker', self._name, exc_info=e)
+            with self._condition:
+                self._active.discard(key)
+                if self._queues[key]:
+                    self._ready.append(key)
+                    self._condition.notify()
+                else:
+                    del self._queues[key]
+
+    @property
+    def queued(self) -> int:
+        with self._condition:
+            return self._queued
+
+    @property
+    def active(self) -> int:
+        with self._condition:
+            return len(self._active)
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._should_shutdown = True
+            self._condition.notify_all()